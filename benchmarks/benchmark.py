@@ -0,0 +1,155 @@
+from __future__ import division
+import argparse
+import json
+import platform
+import sys
+from timeit import default_timer
+import numpy as np
+from scpipy import (DataFormat, DigitalController, Generator, Oscilloscope, State, encode_waveform_data,
+                    get_tcpip_scpi_connection)
+from scpipy.simulator import SimulatedRedPitaya, SimulatorServer
+
+
+def summarize(durations):
+    durations = np.asarray(durations)
+    return {'runs': len(durations),
+            'mean': float(durations.mean()),
+            'median': float(np.median(durations)),
+            'min': float(durations.min()),
+            'max': float(durations.max()),
+            'stdev': float(durations.std())}
+
+
+def measure(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = default_timer()
+        function()
+        durations.append(default_timer() - start)
+    return summarize(durations)
+
+
+def benchmark_query_latency(connection, repeat):
+    oscilloscope = Oscilloscope(connection)
+    return {'ACQ:DEC?': measure(oscilloscope.get_decimation_factor, repeat),
+            'ACQ:TRIG:STAT?': measure(oscilloscope.get_trigger_state, repeat)}
+
+
+def benchmark_get_data(connection, instrument, buffer_sizes, repeat):
+    results = {}
+    for buffer_size in buffer_sizes:
+        if instrument is not None:
+            instrument.buffer_size = buffer_size
+        oscilloscope = Oscilloscope(connection, buffer_size=buffer_size)
+        for data_format in (DataFormat.ASCII, DataFormat.BINARY):
+            oscilloscope.set_data_format(data_format)
+            name = '{}/{}'.format(data_format.name.lower(), buffer_size)
+            results[name] = measure(lambda: oscilloscope.get_data(1), repeat)
+            results[name]['samples_per_second'] = buffer_size / results[name]['median']
+        oscilloscope.set_data_format(DataFormat.ASCII)
+    return results
+
+
+def benchmark_acquisitions(connection, repeat):
+    oscilloscope = Oscilloscope(connection)
+    oscilloscope.set_decimation_factor(1)
+
+    def acquire():
+        oscilloscope.start()
+        oscilloscope.trigger_immediately()
+        oscilloscope.get_acquisition(1, timeout=5)
+
+    start = default_timer()
+    for _ in oscilloscope.stream(1, count=repeat, timeout=5):
+        pass
+    stream_elapsed = default_timer() - start
+
+    results = {'get_acquisition': measure(acquire, repeat)}
+    results['get_acquisition']['acquisitions_per_second'] = 1 / results['get_acquisition']['mean']
+    results['stream'] = {'runs': repeat, 'acquisitions_per_second': repeat / stream_elapsed}
+    return results
+
+
+def benchmark_arbitrary_waveform(connection, repeat, number_of_samples=16384):
+    generator = Generator(connection)
+    oscilloscope = Oscilloscope(connection)
+    data = np.sin(np.linspace(0, 2 * np.pi, number_of_samples))
+
+    def upload():
+        generator.set_arbitrary_waveform_data(1, data)
+        oscilloscope.get_decimation_factor()
+
+    return {'encode': measure(lambda: encode_waveform_data(data), repeat),
+            'upload': measure(upload, repeat)}
+
+
+def benchmark_command_encoding(connection, repeat, calls=10000):
+    template = DigitalController.SET_STATE
+    delimiter = connection.delimiter
+    controller = DigitalController(connection)
+
+    def format_calls():
+        for _ in range(calls):
+            'DIG:PIN {},{}'.format('LED1', State.HIGH.value) + delimiter
+
+    def template_calls():
+        for _ in range(calls):
+            template.encode('LED1', State.HIGH)
+
+    results = {'str.format': measure(format_calls, repeat),
+               'CommandTemplate.encode': measure(template_calls, repeat),
+               'DigitalController.set_state': measure(lambda: controller.set_state('LED1', State.HIGH), repeat)}
+    for name in ('str.format', 'CommandTemplate.encode'):
+        results[name]['calls_per_second'] = calls / results[name]['median']
+    return results
+
+
+def run(host=None, port=5000, repeat=20, buffer_sizes=(1024, 4096, 16384), latency=0.0, bandwidth=None):
+    server = None
+    instrument = None
+    if host is None:
+        instrument = SimulatedRedPitaya(seed=0)
+        server = SimulatorServer(instrument, latency=latency, bandwidth=bandwidth).start()
+        host, port = server.host, server.port
+        target = 'simulator'
+    else:
+        buffer_sizes = (16384,)
+        target = '{}:{}'.format(host, port)
+    try:
+        with get_tcpip_scpi_connection(host, port) as connection:
+            benchmarks = {'query_latency': benchmark_query_latency(connection, repeat),
+                          'command_encoding': benchmark_command_encoding(connection, repeat),
+                          'get_data': benchmark_get_data(connection, instrument, buffer_sizes, repeat),
+                          'acquisitions': benchmark_acquisitions(connection, repeat),
+                          'arbitrary_waveform': benchmark_arbitrary_waveform(connection, repeat)}
+    finally:
+        if server is not None:
+            server.stop()
+    return {'target': target,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'benchmarks': benchmarks}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure scpipy latency, throughput and parse cost.')
+    parser.add_argument('--host', help='Red Pitaya to benchmark instead of the local simulator')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated reply latency in seconds')
+    parser.add_argument('--bandwidth', type=float, help='simulated bandwidth in bytes per second')
+    parser.add_argument('--label', help='free-form label stored with the results, e.g. a version')
+    parser.add_argument('--output', default='benchmark_results.json')
+    arguments = parser.parse_args(argv)
+
+    results = run(arguments.host, arguments.port, arguments.repeat,
+                  latency=arguments.latency, bandwidth=arguments.bandwidth)
+    results['label'] = arguments.label
+    with open(arguments.output, 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+    json.dump(results['benchmarks'], sys.stdout, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import matplotlib.pyplot as plt
+import sys
+import scpipy
+from scpipy.averaging import AcquisitionAverager
+
+def main(host, count=1000):
+    with scpipy.get_tcpip_scpi_connection(host) as connection:
+        generator = scpipy.Generator(connection)
+        generator.reset()
+        generator.set_waveform(1, scpipy.Waveform.SINE)
+        generator.set_frequency(1, 1000)
+        generator.set_amplitude(1, 0.8)
+        generator.set_burst_count(1, 1)
+        generator.set_burst_repetitions(1, 65536)
+        generator.set_burst_period(1, 2000)
+        generator.enable_output(1)
+        generator.enable_burst(1)
+        generator.trigger_immediately(1)
+
+        scope = scpipy.Oscilloscope(connection)
+        scope.reset()
+        scope.set_decimation_factor(64)
+        scope.set_trigger_level(0)
+
+        averager = AcquisitionAverager(histogram_bins=64)
+        averager.extend(scope.stream(1, scpipy.TriggerSource.CH1, scpipy.Edge.POSITIVE, count=count))
+        average = averager.result()
+
+        plt.plot(average.times, average.voltages)
+        plt.fill_between(average.times, averager.minimum, averager.maximum, alpha=0.3)
+        plt.grid(True)
+        plt.show()
+
+if __name__ == '__main__':
+    host = sys.argv[1]
+    main(host)
@@ -0,0 +1,527 @@
+from __future__ import division
+import heapq
+from collections import deque
+from functools import partial, wraps
+from itertools import count
+from select import select
+from time import sleep, time
+import numpy as np
+from scpipy.links import AsyncTcpIpLink, TcpIpAddress
+from scpipy.scpi import (AcquisitionStream, AnalogController, DataFormat, DeadlineExceededError, DigitalController,
+                         Edge, Generator, Oscilloscope, ReceiveBuffer, ScpiConnection, ScpiControlledInterface,
+                         TriggerState)
+
+
+class Return(Exception):
+    def __init__(self, value=None):
+        Exception.__init__(self)
+        self.value = value
+
+
+class Future(object):
+    def __init__(self):
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        if not self._done:
+            raise RuntimeError('Result is not ready yet')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        if not self._done:
+            raise RuntimeError('Result is not ready yet')
+        return self._exception
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._finish()
+
+    def add_done_callback(self, callback):
+        if self._done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def then(self, function):
+        future = Future()
+
+        def chain(source):
+            if source.exception() is not None:
+                future.set_exception(source.exception())
+                return
+            try:
+                value = function(source.result())
+            except Exception as error:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+        self.add_done_callback(chain)
+        return future
+
+    def _finish(self):
+        if self._done:
+            raise RuntimeError('Future is already done')
+        self._done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class Task(Future):
+    def __init__(self, coroutine, loop):
+        Future.__init__(self)
+        self._coroutine = coroutine
+        self._loop = loop
+        loop.call_soon(self._step)
+
+    def _step(self, value=None, exception=None):
+        try:
+            if exception is None:
+                awaited = self._coroutine.send(value)
+            else:
+                awaited = self._coroutine.throw(exception)
+        except StopIteration:
+            self.set_result(None)
+        except Return as returned:
+            self.set_result(returned.value)
+        except Exception as error:
+            self.set_exception(error)
+        else:
+            if isinstance(awaited, (list, tuple)):
+                awaited = gather(*awaited)
+            if not isinstance(awaited, Future):
+                self._loop.call_soon(self._step, None, TypeError('Coroutines must yield futures, '
+                                                                 'got {!r}'.format(awaited)))
+                return
+            awaited.add_done_callback(self._wakeup)
+
+    def _wakeup(self, future):
+        if future.exception() is not None:
+            self._loop.call_soon(self._step, None, future.exception())
+        else:
+            self._loop.call_soon(self._step, future.result())
+
+
+def gather(*futures):
+    gathered = Future()
+    results = [None] * len(futures)
+    remaining = [len(futures)]
+
+    def collect(index, future):
+        if gathered.done():
+            return
+        if future.exception() is not None:
+            gathered.set_exception(future.exception())
+            return
+        results[index] = future.result()
+        remaining[0] -= 1
+        if not remaining[0]:
+            gathered.set_result(results)
+
+    if not futures:
+        gathered.set_result(results)
+    for index, future in enumerate(futures):
+        future.add_done_callback(partial(collect, index))
+    return gathered
+
+
+def coroutine(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self.loop.create_task(method(self, *args, **kwargs))
+    return wrapper
+
+
+class EventLoop(object):
+    def __init__(self):
+        self._ready = deque()
+        self._timers = []
+        self._sequence = count()
+        self._readers = {}
+        self._writers = {}
+
+    def call_soon(self, callback, *args):
+        self._ready.append((callback, args))
+
+    def call_later(self, delay, callback, *args):
+        heapq.heappush(self._timers, (time() + delay, next(self._sequence), callback, args))
+
+    def add_reader(self, fileno, callback, *args):
+        self._readers[fileno] = (callback, args)
+
+    def remove_reader(self, fileno):
+        self._readers.pop(fileno, None)
+
+    def add_writer(self, fileno, callback, *args):
+        self._writers[fileno] = (callback, args)
+
+    def remove_writer(self, fileno):
+        self._writers.pop(fileno, None)
+
+    def create_task(self, coroutine):
+        return Task(coroutine, self)
+
+    def sleep(self, delay, result=None):
+        future = Future()
+        self.call_later(delay, future.set_result, result)
+        return future
+
+    def run_until_complete(self, awaitable):
+        future = self._ensure_future(awaitable)
+        while not future.done():
+            self._run_once()
+        return future.result()
+
+    def _ensure_future(self, awaitable):
+        if isinstance(awaitable, Future):
+            return awaitable
+        if isinstance(awaitable, (list, tuple)):
+            return gather(*[self._ensure_future(item) for item in awaitable])
+        return self.create_task(awaitable)
+
+    def _run_once(self):
+        timeout = None
+        if self._ready:
+            timeout = 0
+        elif self._timers:
+            timeout = max(0, self._timers[0][0] - time())
+
+        if self._readers or self._writers:
+            readable, writable, _ = select(list(self._readers), list(self._writers), [], timeout)
+        elif timeout is None:
+            raise RuntimeError('Event loop has nothing left to wait for')
+        else:
+            sleep(timeout)
+            readable = writable = []
+
+        for fileno in readable:
+            if fileno in self._readers:
+                self._ready.append(self._readers[fileno])
+        for fileno in writable:
+            if fileno in self._writers:
+                self._ready.append(self._writers[fileno])
+
+        now = time()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, callback, args = heapq.heappop(self._timers)
+            self._ready.append((callback, args))
+
+        for _ in range(len(self._ready)):
+            callback, args = self._ready.popleft()
+            callback(*args)
+
+
+class AsyncScpiConnection(object):
+    delimiter = ReceiveBuffer.delimiter
+    resync_query = ScpiConnection.resync_query
+    resync_reply = ScpiConnection.resync_reply
+
+    def __init__(self, link, loop, buffer_size=65536):
+        self._link = link
+        self.loop = loop
+        self._received = ReceiveBuffer(buffer_size)
+        self._output = bytearray()
+        self._replies = deque()
+        self._connected = False
+        self.stale_replies = 0
+
+    def open(self):
+        self._link.open()
+        connected = Future()
+        self.loop.add_writer(self._link.fileno(), self._on_connected, connected)
+        return connected
+
+    def close(self):
+        fileno = self._link.fileno()
+        self.loop.remove_reader(fileno)
+        self.loop.remove_writer(fileno)
+        self._link.close()
+        self._connected = False
+        self._fail_replies(IOError('Connection closed while waiting for a reply'))
+
+    def write(self, message):
+        self._output += message + self.delimiter
+        if self._connected:
+            self.loop.add_writer(self._link.fileno(), self._on_writable)
+        return len(message)
+
+    def query(self, message, binary=False, timeout=None):
+        reply = Future()
+        self._replies.append((reply, binary))
+        self.write(message)
+        if timeout is not None:
+            self.loop.call_later(timeout, self._expire, reply, message)
+        return reply
+
+    def _expire(self, reply, message):
+        if reply.done():
+            return
+        error = DeadlineExceededError('No reply to {} before the deadline'.format(message))
+        markers = 1
+        while self._replies:
+            pending, _ = self._replies.popleft()
+            if pending is None:
+                markers += 1
+            else:
+                pending.set_exception(error)
+        self._replies.extend([(None, None)] * markers)
+        self.write(self.resync_query)
+
+    def _on_connected(self, connected):
+        fileno = self._link.fileno()
+        self.loop.remove_writer(fileno)
+        try:
+            self._link.check_connection()
+        except Exception as error:
+            connected.set_exception(error)
+            return
+        self._connected = True
+        self.loop.add_reader(fileno, self._on_readable)
+        if self._output:
+            self.loop.add_writer(fileno, self._on_writable)
+        connected.set_result(self)
+
+    def _on_writable(self):
+        sent = self._link.write(memoryview(self._output))
+        del self._output[:sent]
+        if not self._output:
+            self.loop.remove_writer(self._link.fileno())
+
+    def _on_readable(self):
+        received = self._received.receive(self._link, max(4096, self._received.missing))
+        if received is None:
+            return
+        if not received:
+            self.close()
+            return
+        while self._replies:
+            reply, binary = self._replies[0]
+            if reply is None:
+                value = self._received.parse_reply()
+                if value is None:
+                    break
+                if value == self.resync_reply:
+                    self._replies.popleft()
+                else:
+                    self.stale_replies += 1
+                continue
+            try:
+                value = self._received.parse_block() if binary else self._received.parse_line()
+            except ValueError as error:
+                self._replies.popleft()
+                reply.set_exception(error)
+                continue
+            if value is None:
+                break
+            self._replies.popleft()
+            reply.set_result(value)
+
+    def _fail_replies(self, error):
+        while self._replies:
+            reply, _ = self._replies.popleft()
+            if reply is not None and not reply.done():
+                reply.set_exception(error)
+
+
+def get_async_tcpip_scpi_connection(host, loop, port=5000):
+    link = AsyncTcpIpLink(TcpIpAddress(host, port))
+    return AsyncScpiConnection(link, loop)
+
+
+class AsyncScpiControlledInterface(ScpiControlledInterface):
+    @property
+    def loop(self):
+        return self._connection.loop
+
+    def query(self, message, timeout=None):
+        return self._connection.query(message, timeout=timeout)
+
+    def query_block(self, message, timeout=None):
+        return self._connection.query(message, binary=True, timeout=timeout)
+
+    def _query_value(self, message, convert):
+        return self.query(message).then(convert)
+
+    def _query_block_value(self, message, convert):
+        return self.query_block(message).then(convert)
+
+    def _query_values(self, messages, convert, binary=False):
+        return gather(*[self._connection.query(message, binary).then(convert) for message in messages])
+
+    def _query_setting(self, key, message, convert):
+        if key in self._cache:
+            cached = Future()
+            cached.set_result(self._cache.get(key))
+            return cached
+
+        def remember(value):
+            self._cache.update(key, value)
+            return value
+
+        return self._query_value(message, convert).then(remember)
+
+
+class AsyncDigitalController(DigitalController, AsyncScpiControlledInterface):
+    pass
+
+
+class AsyncAnalogController(AnalogController, AsyncScpiControlledInterface):
+    pass
+
+
+class AsyncGenerator(Generator, AsyncScpiControlledInterface):
+    pass
+
+
+class AsyncOscilloscope(Oscilloscope, AsyncScpiControlledInterface):
+    @coroutine
+    def start(self):
+        self.command('ACQ:START')
+        decimation_factor = yield self.get_decimation_factor()
+        yield self.loop.sleep(self._buffer_duration(decimation_factor))
+
+    @coroutine
+    def set_decimation_factor(self, factor=1, timeout=None):
+        if not self._cache.changes('decimation_factor', factor):
+            return
+        self._send_encoded(self.SET_DECIMATION_FACTOR.encode(factor))
+        deadline = time() + (self.confirmation_timeout if timeout is None else timeout)
+        while True:
+            decimation_factor = yield self._query_value('ACQ:DEC?', int)
+            if decimation_factor == factor:
+                break
+            if time() >= deadline:
+                raise DeadlineExceededError('Decimation factor {} was not confirmed in time'.format(factor))
+        self._cache.update('decimation_factor', factor)
+        self._cache.invalidate('trigger_delay_in_ns')
+
+    def _read_data(self, channel, query, out=None):
+        if self._data_format == DataFormat.BINARY or out is not None:
+            return self._get_voltages(channel, query, out)
+        return self._get_voltages(channel, query).then(lambda voltages: voltages.tolist())
+
+    @coroutine
+    def get_acquisition(self, channel, timeout=None, window=None, out=None):
+        decimation_factor = yield self.get_decimation_factor()
+        detected_at = yield self.wait_for_trigger(timeout, decimation_factor)
+        if window is None:
+            voltages, start_time = (yield self._get_voltages(channel, out=out)), 0.0
+        else:
+            trigger_position = yield self.get_trigger_position()
+            query, start_time = self._window_query(window, decimation_factor, trigger_position)
+            voltages = yield self._get_voltages(channel, query, out)
+        timestamp = time()
+        self.trigger_wait.record_readout(detected_at, timestamp)
+        trigger_delay_in_samples = self._cache.get('trigger_delay_in_samples')
+        raise Return(self._build_acquisition(channel, voltages, decimation_factor,
+                                             trigger_delay_in_samples, timestamp, start_time))
+
+    @coroutine
+    def get_acquisitions(self, channels=(1, 2), timeout=None, window=None):
+        channels = tuple(channels)
+        decimation_factor = yield self.get_decimation_factor()
+        detected_at = yield self.wait_for_trigger(timeout, decimation_factor)
+        if window is None:
+            query, start_time = 'DATA?', 0.0
+        else:
+            trigger_position = yield self.get_trigger_position()
+            query, start_time = self._window_query(window, decimation_factor, trigger_position)
+        voltages = yield self._get_channels_voltages(channels, query)
+        timestamp = time()
+        self.trigger_wait.record_readout(detected_at, timestamp)
+        trigger_delay_in_samples = self._cache.get('trigger_delay_in_samples')
+        raise Return(self._build_acquisition(channels, np.vstack(voltages), decimation_factor,
+                                             trigger_delay_in_samples, timestamp, start_time))
+
+    def stream(self, channel, trigger_source=None, edge=Edge.POSITIVE, count=None, period=None, timeout=None,
+               window=None, out=None):
+        return AsyncAcquisitionStream(self, channel, trigger_source, edge, count, period, timeout, window, out)
+
+    @coroutine
+    def wait_for_trigger(self, timeout=None, decimation_factor=None):
+        if decimation_factor is None:
+            decimation_factor = yield self.get_decimation_factor()
+        trigger_wait = self.trigger_wait
+        if timeout is None:
+            timeout = trigger_wait.timeout
+        start = time()
+        interval = trigger_wait.poll_interval(self._buffer_duration(decimation_factor))
+        polls = 0
+        while True:
+            polls += 1
+            trigger_state = yield self.get_trigger_state()
+            if trigger_state == TriggerState.DISABLED:
+                break
+            if timeout is not None and time() - start >= timeout:
+                trigger_wait._timed_out(timeout)
+            yield self.loop.sleep(interval)
+            interval = min(trigger_wait.max_interval, interval * trigger_wait.backoff)
+        detected_at = time()
+        trigger_wait.statistics.record_trigger(detected_at - start, polls, 0.0)
+        raise Return(detected_at)
+
+
+class AsyncAcquisitionStream(AcquisitionStream):
+    def __init__(self, *args, **kwargs):
+        AcquisitionStream.__init__(self, *args, **kwargs)
+        self._fill_time = None
+        self._armed_at = None
+
+    @property
+    def loop(self):
+        return self._oscilloscope.loop
+
+    def __iter__(self):
+        raise TypeError('Asynchronous streams are read with read() inside a coroutine')
+
+    def readouts(self):
+        raise TypeError('Asynchronous streams are read with read() inside a coroutine')
+
+    @coroutine
+    def read(self):
+        oscilloscope = self._oscilloscope
+        statistics = self.statistics
+        if self._armed_at is None:
+            self.decimation_factor = yield oscilloscope.get_decimation_factor()
+            self.trigger_delay_in_samples = yield oscilloscope.get_trigger_delay_in_samples()
+            self._fill_time = oscilloscope._buffer_duration(self.decimation_factor)
+            statistics.started = time()
+            oscilloscope.command('ACQ:START')
+            self._armed_at = time()
+        if self.count is not None and statistics.acquired >= self.count:
+            raise Return(None)
+        remaining = self._armed_at + self._fill_time - time()
+        if remaining > 0:
+            yield self.loop.sleep(remaining)
+        if self._stopping.is_set():
+            raise Return(None)
+        self._arm_trigger(statistics.last_timestamp)
+        detected_at = yield oscilloscope.wait_for_trigger(self.timeout, self.decimation_factor)
+        if self.window is None:
+            query, start_time = 'DATA?', 0.0
+        else:
+            trigger_position = yield oscilloscope.get_trigger_position()
+            query, start_time = oscilloscope._window_query(self.window, self.decimation_factor, trigger_position)
+        voltages = yield oscilloscope._get_voltages(self.channel, query, self.out)
+        timestamp = time()
+        oscilloscope.trigger_wait.record_readout(detected_at, timestamp)
+        oscilloscope.command('ACQ:START')
+        self._armed_at = time()
+
+        self._count_dropped(timestamp)
+        statistics.acquired += 1
+        statistics.last_timestamp = timestamp
+        raise Return(self.build(voltages, timestamp, start_time))
@@ -0,0 +1,127 @@
+from __future__ import division
+import numpy as np
+from scpipy.scpi import Acquisition
+
+
+class AcquisitionAverager(object):
+    def __init__(self, histogram_bins=None, histogram_range=(-1.0, 1.0)):
+        self.histogram_bins = histogram_bins
+        self.histogram_range = histogram_range
+        self.count = 0
+        self.mean = None
+        self.minimum = None
+        self.maximum = None
+        self.histogram = None
+        self.underflow = None
+        self.overflow = None
+        self._m2 = None
+        self._delta = None
+        self._template = None
+
+    def add(self, acquisition):
+        voltages = np.asarray(acquisition.voltages, dtype=float)
+        if self.count == 0:
+            self._start(acquisition, voltages)
+        elif voltages.shape != self.mean.shape:
+            raise ValueError('Acquisition shape {} does not match the average {}'.format(voltages.shape,
+                                                                                       self.mean.shape))
+        self.count += 1
+        delta = self._delta
+        np.subtract(voltages, self.mean, out=delta)
+        self.mean += delta / self.count
+        delta *= voltages - self.mean
+        self._m2 += delta
+        np.minimum(self.minimum, voltages, out=self.minimum)
+        np.maximum(self.maximum, voltages, out=self.maximum)
+        if self.histogram is not None:
+            self._add_to_histogram(voltages)
+        return self
+
+    def extend(self, acquisitions):
+        for acquisition in acquisitions:
+            self.add(acquisition)
+        return self
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self._template = other._template
+            self.count = other.count
+            self.mean = other.mean.copy()
+            self._m2 = other._m2.copy()
+            self._delta = np.empty_like(other.mean)
+            self.minimum = other.minimum.copy()
+            self.maximum = other.maximum.copy()
+            if other.histogram is not None:
+                self.histogram = other.histogram.copy()
+                self.underflow = other.underflow.copy()
+                self.overflow = other.overflow.copy()
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self._m2 += other._m2 + delta ** 2 * (self.count * other.count / count)
+        self.mean += delta * (other.count / count)
+        self.count = count
+        np.minimum(self.minimum, other.minimum, out=self.minimum)
+        np.maximum(self.maximum, other.maximum, out=self.maximum)
+        if self.histogram is not None and other.histogram is not None:
+            self.histogram += other.histogram
+            self.underflow += other.underflow
+            self.overflow += other.overflow
+        return self
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return None
+        return self._m2 / (self.count - 1)
+
+    @property
+    def standard_deviation(self):
+        variance = self.variance
+        return None if variance is None else np.sqrt(variance)
+
+    @property
+    def standard_error(self):
+        variance = self.variance
+        return None if variance is None else np.sqrt(variance / self.count)
+
+    @property
+    def histogram_edges(self):
+        if self.histogram_bins is None:
+            return None
+        return np.linspace(self.histogram_range[0], self.histogram_range[1], self.histogram_bins + 1)
+
+    def result(self):
+        if self.count == 0:
+            return None
+        template = self._template
+        return Acquisition(self.mean.copy(), template.sampling_interval, template.start_time, template.channel,
+                           template.decimation_factor, template.trigger_delay_in_samples, template.timestamp)
+
+    def reset(self):
+        self.__init__(self.histogram_bins, self.histogram_range)
+
+    def _start(self, acquisition, voltages):
+        self._template = acquisition
+        self.mean = np.zeros(voltages.shape)
+        self._m2 = np.zeros(voltages.shape)
+        self._delta = np.empty(voltages.shape)
+        self.minimum = voltages.copy()
+        self.maximum = voltages.copy()
+        if self.histogram_bins is not None:
+            self.histogram = np.zeros(voltages.shape + (self.histogram_bins,), dtype=np.uint32)
+            self.underflow = np.zeros(voltages.shape, dtype=np.uint32)
+            self.overflow = np.zeros(voltages.shape, dtype=np.uint32)
+
+    def _add_to_histogram(self, voltages):
+        low, high = self.histogram_range
+        samples = voltages.ravel()
+        inside = np.flatnonzero((samples >= low) & (samples <= high))
+        bins = np.floor((samples[inside] - low) * (self.histogram_bins / (high - low))).astype(np.intp)
+        np.minimum(bins, self.histogram_bins - 1, out=bins)
+        counts = self.histogram.reshape(-1, self.histogram_bins)
+        counts[inside, bins] += 1
+        self.underflow += voltages < low
+        self.overflow += voltages > high
@@ -0,0 +1,75 @@
+from multiprocessing.pool import ThreadPool
+from time import time
+from scpipy.scpi import AnalogController, DigitalController, Generator, Oscilloscope, get_tcpip_scpi_connection
+
+
+class DeviceResult(object):
+    def __init__(self, host, value=None, error=None, elapsed=None):
+        self.host = host
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        outcome = 'error={!r}'.format(self.error) if self.error is not None else 'ok'
+        return '<DeviceResult {} {} in {:.6f} s>'.format(self.host, outcome, self.elapsed)
+
+
+class Device(object):
+    def __init__(self, host, connection):
+        self.host = host
+        self.connection = connection
+        self.generator = Generator(connection)
+        self.oscilloscope = Oscilloscope(connection)
+        self.digital = DigitalController(connection)
+        self.analog = AnalogController(connection)
+
+
+class DeviceGroup(object):
+    def __init__(self, hosts, port=5000, connect=get_tcpip_scpi_connection, max_workers=None):
+        self.hosts = list(hosts)
+        self.devices = [Device(host, connect(host, port)) for host in self.hosts]
+        self._max_workers = max_workers or len(self.hosts) or 1
+        self._pool = None
+
+    def open(self):
+        self._pool = ThreadPool(self._max_workers)
+        return self.map(lambda device: device.connection.open())
+
+    def close(self):
+        if self._pool is None:
+            return []
+        try:
+            return self.map(lambda device: device.connection.close())
+        finally:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def map(self, function, *args, **kwargs):
+        if self._pool is None:
+            raise RuntimeError('Device group is not open')
+        return self._pool.map(lambda device: self._run(device, function, args, kwargs), self.devices)
+
+    def acquire(self, channel):
+        return self.map(lambda device: device.oscilloscope.get_acquisition(channel))
+
+    @staticmethod
+    def _run(device, function, args, kwargs):
+        start = time()
+        try:
+            value = function(device, *args, **kwargs)
+        except Exception as error:
+            return DeviceResult(device.host, error=error, elapsed=time() - start)
+        return DeviceResult(device.host, value=value, elapsed=time() - start)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,127 @@
+from __future__ import division
+from collections import defaultdict
+from timeit import default_timer
+import numpy as np
+
+
+def message_header(message):
+    return message.split(' ', 1)[0]
+
+
+class MessageRecord(object):
+    __slots__ = ('header', 'bytes_sent', 'bytes_received', 'chunks', 'started', 'elapsed')
+
+    def __init__(self, header, bytes_sent, started):
+        self.header = header
+        self.bytes_sent = bytes_sent
+        self.bytes_received = 0
+        self.chunks = 0
+        self.started = started
+        self.elapsed = None
+
+    @property
+    def is_query(self):
+        return self.header.endswith('?')
+
+    def __repr__(self):
+        return '<MessageRecord {} sent={} received={} chunks={} elapsed={}>'.format(
+            self.header, self.bytes_sent, self.bytes_received, self.chunks, self.elapsed)
+
+
+class InstrumentationHook(object):
+    def before(self, record):
+        pass
+
+    def after(self, record):
+        pass
+
+
+class Instrumentation(object):
+    clock = staticmethod(default_timer)
+
+    def __init__(self, *hooks):
+        self.hooks = list(hooks)
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def start(self, message, bytes_sent):
+        record = MessageRecord(message_header(message), bytes_sent, self.clock())
+        for hook in self.hooks:
+            hook.before(record)
+        return record
+
+    def finish(self, record, bytes_received=0, chunks=0):
+        record.elapsed = self.clock() - record.started
+        record.bytes_received = bytes_received
+        record.chunks = chunks
+        for hook in self.hooks:
+            hook.after(record)
+        return record
+
+
+class HistogramCollector(InstrumentationHook):
+    def __init__(self, bin_edges=None):
+        if bin_edges is None:
+            bin_edges = np.logspace(-6, 1, 71)
+        self.bin_edges = np.asarray(bin_edges, dtype=float)
+        self._statistics = defaultdict(self._new_statistics)
+
+    def _new_statistics(self):
+        return {'count': 0, 'total': 0.0, 'min': float('inf'), 'max': 0.0,
+                'bytes_sent': 0, 'bytes_received': 0, 'chunks': 0,
+                'histogram': np.zeros(len(self.bin_edges) + 1, dtype=np.int64)}
+
+    @property
+    def headers(self):
+        return sorted(self._statistics)
+
+    def after(self, record):
+        statistics = self._statistics[record.header]
+        statistics['count'] += 1
+        statistics['total'] += record.elapsed
+        statistics['min'] = min(statistics['min'], record.elapsed)
+        statistics['max'] = max(statistics['max'], record.elapsed)
+        statistics['bytes_sent'] += record.bytes_sent
+        statistics['bytes_received'] += record.bytes_received
+        statistics['chunks'] += record.chunks
+        statistics['histogram'][np.searchsorted(self.bin_edges, record.elapsed, side='right')] += 1
+
+    def histogram(self, header):
+        return self._statistics[header]['histogram'].copy()
+
+    def percentile(self, header, q):
+        statistics = self._statistics.get(header)
+        if statistics is None or not statistics['count']:
+            return None
+        cumulative = np.cumsum(statistics['histogram'])
+        index = int(np.searchsorted(cumulative, q / 100 * statistics['count']))
+        if index >= len(self.bin_edges):
+            return statistics['max']
+        return min(self.bin_edges[index], statistics['max'])
+
+    def summary(self):
+        summary = {}
+        for header, statistics in self._statistics.items():
+            summary[header] = {'count': statistics['count'],
+                               'total': statistics['total'],
+                               'mean': statistics['total'] / statistics['count'],
+                               'min': statistics['min'],
+                               'max': statistics['max'],
+                               'p50': self.percentile(header, 50),
+                               'p99': self.percentile(header, 99),
+                               'bytes_sent': statistics['bytes_sent'],
+                               'bytes_received': statistics['bytes_received'],
+                               'chunks': statistics['chunks']}
+        return summary
+
+    def dominant(self, number=5):
+        ranked = sorted(self._statistics.items(), key=lambda item: item[1]['total'], reverse=True)
+        return [(header, statistics['total']) for header, statistics in ranked[:number]]
+
+    def reset(self):
+        self._statistics.clear()
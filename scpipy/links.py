@@ -1,8 +1,18 @@
+from __future__ import division
 from abc import ABCMeta, abstractmethod
-from socket import socket
+from collections import deque, namedtuple
+from errno import EAGAIN, EALREADY, EINPROGRESS, EISCONN, EWOULDBLOCK
+from os import strerror
+from socket import (error as socket_error, socket, socketpair, timeout as socket_timeout, AF_UNIX, IPPROTO_TCP,
+                    SOCK_STREAM, SOL_SOCKET, SO_ERROR, SO_RCVBUF, SO_SNDBUF, TCP_NODELAY)
+from struct import Struct
+from threading import Thread
+from time import sleep
+from timeit import default_timer
 
 class Link(object):
     __metaclass__ = ABCMeta
+    timeout = None
 
     @abstractmethod
     def open(self):
@@ -20,6 +30,14 @@ class Link(object):
     def write(self, message):
         pass
 
+    def read_into(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def set_timeout(self, timeout):
+        pass
+
     
 class TcpIpAddress(object):
     def __init__(self, host, port):
@@ -27,26 +45,297 @@ class TcpIpAddress(object):
         self.port = port
 
 
-class TcpIpLink(Link):
-    def __init__(self, address, timeout=None, alt_socket=None):
-        self.address = address
+def configure_socket(tcp_socket, no_delay=True, receive_buffer_size=None, send_buffer_size=None):
+    if no_delay:
+        tcp_socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+    if receive_buffer_size is not None:
+        tcp_socket.setsockopt(SOL_SOCKET, SO_RCVBUF, receive_buffer_size)
+    if send_buffer_size is not None:
+        tcp_socket.setsockopt(SOL_SOCKET, SO_SNDBUF, send_buffer_size)
+
+
+class SocketLink(Link):
+    def __init__(self, stream_socket, timeout=None):
         self.timeout = timeout
-        self._socket = alt_socket or socket()
+        self._socket = stream_socket
 
         if timeout is not None:
             self._socket.settimeout(timeout)
-        
+
+    def set_timeout(self, timeout):
+        self._socket.settimeout(timeout)
+
+    def close(self):
+        self._socket.close()
+
+    def read(self, number_of_bytes):
+        return self._socket.recv(number_of_bytes)
+
+    def read_into(self, buffer):
+        return self._socket.recv_into(buffer)
+
+    def write(self, request):
+        self._socket.sendall(request)
+        return len(request)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class TcpIpLink(SocketLink):
+    def __init__(self, address, timeout=None, alt_socket=None, no_delay=True, receive_buffer_size=262144,
+                 send_buffer_size=None):
+        SocketLink.__init__(self, alt_socket or socket(), timeout)
+        self.address = address
+        configure_socket(self._socket, no_delay, receive_buffer_size, send_buffer_size)
+
     def open(self):
         self._socket.connect((self.address.host, self.address.port))
 
+
+class UnixSocketLink(SocketLink):
+    def __init__(self, path, timeout=None, alt_socket=None, receive_buffer_size=262144, send_buffer_size=None):
+        SocketLink.__init__(self, alt_socket or socket(AF_UNIX, SOCK_STREAM), timeout)
+        self.path = path
+        configure_socket(self._socket, False, receive_buffer_size, send_buffer_size)
+
+    def open(self):
+        self._socket.connect(self.path)
+
+
+class LoopbackLink(SocketLink):
+    def __init__(self, serve, timeout=None):
+        local_socket, self._remote_socket = socketpair(AF_UNIX, SOCK_STREAM)
+        SocketLink.__init__(self, local_socket, timeout)
+        self._serve = serve
+        self._thread = None
+
+    def open(self):
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        SocketLink.close(self)
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+
+    def _run(self):
+        try:
+            self._serve(self._remote_socket)
+        finally:
+            self._remote_socket.close()
+
+
+class AsyncTcpIpLink(Link):
+    _pending_errors = (EAGAIN, EWOULDBLOCK)
+    _connecting_errors = (EINPROGRESS, EALREADY, EWOULDBLOCK)
+
+    def __init__(self, address, alt_socket=None, no_delay=True, receive_buffer_size=262144, send_buffer_size=None):
+        self.address = address
+        self._socket = alt_socket or socket()
+        self._socket.setblocking(False)
+        configure_socket(self._socket, no_delay, receive_buffer_size, send_buffer_size)
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def open(self):
+        error = self._socket.connect_ex((self.address.host, self.address.port))
+        if error not in (0, EISCONN) + self._connecting_errors:
+            raise socket_error(error, strerror(error))
+
+    def check_connection(self):
+        error = self._socket.getsockopt(SOL_SOCKET, SO_ERROR)
+        if error:
+            raise socket_error(error, strerror(error))
+
     def close(self):
         self._socket.close()
 
     def read(self, number_of_bytes):
-        return self._socket.recv(number_of_bytes)
+        try:
+            return self._socket.recv(number_of_bytes)
+        except socket_error as error:
+            if error.errno in self._pending_errors:
+                return None
+            raise
+
+    def read_into(self, buffer):
+        try:
+            return self._socket.recv_into(buffer)
+        except socket_error as error:
+            if error.errno in self._pending_errors:
+                return None
+            raise
+
+    def write(self, request):
+        try:
+            return self._socket.send(request)
+        except socket_error as error:
+            if error.errno in self._pending_errors:
+                return 0
+            raise
+
+
+TraceRecord = namedtuple('TraceRecord', 'direction timestamp payload')
+
+TRACE_MAGIC = 'SCPITRC1'
+TRACE_RECORD = Struct('<cdI')
+WRITTEN = 'W'
+READ = 'R'
+
+
+def read_trace(trace):
+    trace_file = open(trace, 'rb') if isinstance(trace, basestring) else trace
+    try:
+        if trace_file.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError('Not a link trace')
+        while True:
+            header = trace_file.read(TRACE_RECORD.size)
+            if not header:
+                return
+            if len(header) < TRACE_RECORD.size:
+                raise ValueError('Truncated link trace')
+            direction, timestamp, length = TRACE_RECORD.unpack(header)
+            payload = trace_file.read(length)
+            if len(payload) < length:
+                raise ValueError('Truncated link trace')
+            yield TraceRecord(direction, timestamp, payload)
+    finally:
+        if trace_file is not trace:
+            trace_file.close()
+
+
+def _to_bytes(data):
+    return data.tobytes() if isinstance(data, memoryview) else bytes(data)
+
+
+class RecordingLink(Link):
+    clock = staticmethod(default_timer)
+
+    def __init__(self, link, trace):
+        self.link = link
+        self._trace = trace
+        self._trace_file = None
+        self._started = None
+
+    @property
+    def timeout(self):
+        return self.link.timeout
+
+    def set_timeout(self, timeout):
+        self.link.set_timeout(timeout)
+
+    def open(self):
+        self._trace_file = open(self._trace, 'wb') if isinstance(self._trace, basestring) else self._trace
+        self._trace_file.write(TRACE_MAGIC)
+        self._started = self.clock()
+        self.link.open()
+
+    def close(self):
+        try:
+            self.link.close()
+        finally:
+            if self._trace_file is not self._trace:
+                self._trace_file.close()
+            else:
+                self._trace_file.flush()
+
+    def read(self, number_of_bytes):
+        data = self.link.read(number_of_bytes)
+        if data:
+            self._record(READ, data)
+        return data
+
+    def read_into(self, buffer):
+        received = self.link.read_into(buffer)
+        if received:
+            self._record(READ, buffer[:received])
+        return received
 
     def write(self, request):
-        return self._socket.send(request)
+        sent = self.link.write(request)
+        if sent:
+            self._record(WRITTEN, request[:sent])
+        return sent
+
+    def _record(self, direction, payload):
+        payload = _to_bytes(payload)
+        self._trace_file.write(TRACE_RECORD.pack(direction, self.clock() - self._started, len(payload)))
+        self._trace_file.write(payload)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ReplayLink(Link):
+    clock = staticmethod(default_timer)
+
+    def __init__(self, trace, speed=None, strict=False):
+        self.speed = speed
+        self.strict = strict
+        self._reads = deque()
+        self._expected_writes = bytearray()
+        for record in read_trace(trace):
+            if record.direction == READ:
+                self._reads.append(record)
+            else:
+                self._expected_writes += record.payload
+        self._written = 0
+        self._started = None
+        self._read_timeout = None
+
+    def set_timeout(self, timeout):
+        self._read_timeout = timeout
+
+    def open(self):
+        self._started = self.clock()
+
+    def close(self):
+        pass
+
+    def read(self, number_of_bytes):
+        if not self._reads:
+            return ''
+        record = self._reads.popleft()
+        try:
+            self._wait_until(record.timestamp)
+        except socket_timeout:
+            self._reads.appendleft(record)
+            raise
+        if len(record.payload) > number_of_bytes:
+            self._reads.appendleft(record._replace(payload=record.payload[number_of_bytes:]))
+        return record.payload[:number_of_bytes]
+
+    def write(self, request):
+        if self.strict:
+            expected = self._expected_writes[self._written:self._written + len(request)]
+            request = _to_bytes(request)
+            if expected != request:
+                raise ValueError('Replay diverged from the trace at byte {}: expected {!r}, got {!r}'.format(
+                    self._written, bytes(expected), request))
+        self._written += len(request)
+        return len(request)
+
+    def _wait_until(self, timestamp):
+        if not self.speed:
+            return
+        delay = self._started + timestamp / self.speed - self.clock()
+        if self._read_timeout is not None and delay > self._read_timeout:
+            sleep(self._read_timeout)
+            raise socket_timeout('timed out')
+        if delay > 0:
+            sleep(delay)
 
     def __enter__(self):
         self.open()
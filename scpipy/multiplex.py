@@ -0,0 +1,264 @@
+from collections import deque
+from contextlib import contextmanager
+from threading import Event, Lock, Thread, local
+from time import time
+from scpipy.links import TcpIpAddress, TcpIpLink
+from scpipy.scpi import DeadlineExceededError, ReceiveBuffer, ScpiConnection
+
+
+class ReplyFuture(object):
+    def __init__(self, binary=None):
+        self.binary = binary
+        self._done = Event()
+        self._value = None
+        self._exception = None
+
+    @property
+    def resolved(self):
+        return self._done.is_set()
+
+    @property
+    def value(self):
+        return self.result()
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise DeadlineExceededError('Timed out waiting for a reply')
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+    def set_result(self, value):
+        self._value = value
+        self._done.set()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._done.set()
+
+
+class _ResyncMarker(ReplyFuture):
+    pass
+
+
+def is_query(message):
+    return message.split(' ', 1)[0].endswith('?')
+
+
+class MultiplexedScpiConnection(object):
+    delimiter = ReceiveBuffer.delimiter
+    resync_query = ScpiConnection.resync_query
+    resync_reply = ScpiConnection.resync_reply
+
+    def __init__(self, link, buffer_size=65536, timeout=None):
+        self._link = link
+        self._received = ReceiveBuffer(buffer_size)
+        self.timeout = timeout
+        self.stale_replies = 0
+        self._markers = 0
+        self._markers_lock = Lock()
+        self._submissions = deque()
+        self._pending = deque()
+        self._submitted = Event()
+        self._expecting = Event()
+        self._local = local()
+        self._closed = False
+        self._error = None
+        self._writer = None
+        self._reader = None
+
+    def open(self):
+        self._link.open()
+        self._closed = False
+        self._writer = Thread(target=self._write_submissions)
+        self._reader = Thread(target=self._read_replies)
+        for thread in (self._writer, self._reader):
+            thread.daemon = True
+            thread.start()
+
+    def close(self):
+        self._closed = True
+        if self._writer is None:
+            return
+        self._submitted.set()
+        self._writer.join()
+        self._link.close()
+        self._fail(IOError('Connection closed while waiting for a reply'))
+        self._expecting.set()
+        self._reader.join(1.0)
+        self._writer = self._reader = None
+
+    def write(self, message, timeout=None):
+        reply = ReplyFuture() if is_query(message) else None
+        if reply is not None:
+            self._replies.append(reply)
+        self._submit(message, reply)
+        return len(message)
+
+    def send_query(self, message, binary=False):
+        reply = ReplyFuture(binary)
+        self._submit(message, reply)
+        return reply
+
+    def read(self, number_of_bytes=4096, timeout=None):
+        return self._next_reply(timeout)
+
+    def read_block(self, number_of_bytes=4096, timeout=None):
+        return self._next_reply(timeout)
+
+    def flush(self):
+        batch = self._local.__dict__.get('batch')
+        if not batch:
+            return 0
+        messages, replies = batch
+        self._local.batch = None
+        messages.append('')
+        data = self.delimiter.join(messages)
+        self._enqueue(data, replies)
+        return len(data)
+
+    @contextmanager
+    def deadline(self, timeout):
+        previous = self._local.__dict__.get('deadline')
+        deadline = time() + timeout
+        self._local.deadline = deadline if previous is None else min(deadline, previous)
+        try:
+            yield self
+        finally:
+            self._local.deadline = previous
+
+    @contextmanager
+    def batch(self):
+        outermost = not self._local.__dict__.get('batch_depth')
+        self._local.batch_depth = self._local.__dict__.get('batch_depth', 0) + 1
+        if outermost:
+            self._local.batch = ([], [])
+        try:
+            yield self
+        finally:
+            self._local.batch_depth -= 1
+            if outermost:
+                self.flush()
+
+    @property
+    def _replies(self):
+        replies = self._local.__dict__.get('replies')
+        if replies is None:
+            replies = self._local.replies = deque()
+        return replies
+
+    def _next_reply(self, timeout=None):
+        self.flush()
+        if not self._replies:
+            raise IOError('No query is waiting for a reply on this thread')
+        reply = self._replies.popleft()
+        try:
+            return reply.result(self._remaining(timeout))
+        except DeadlineExceededError:
+            if not reply.resolved:
+                self._resynchronize()
+            raise
+
+    def _remaining(self, timeout):
+        if timeout is None:
+            timeout = self.timeout
+        deadline = self._local.__dict__.get('deadline')
+        if deadline is None:
+            return timeout
+        remaining = max(0.0, deadline - time())
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def _resynchronize(self):
+        with self._markers_lock:
+            self._markers += 1
+        self._enqueue(self.resync_query + self.delimiter, [_ResyncMarker()])
+
+    def _submit(self, message, reply):
+        batch = self._local.__dict__.get('batch')
+        if batch is not None:
+            batch[0].append(message)
+            if reply is not None:
+                batch[1].append(reply)
+            return
+        self._enqueue(message + self.delimiter, [reply] if reply is not None else [])
+
+    def _enqueue(self, data, replies):
+        if self._closed or self._error is not None:
+            raise IOError('Connection is closed')
+        self._submissions.append((data, replies))
+        self._submitted.set()
+
+    def _write_submissions(self):
+        while True:
+            self._submitted.clear()
+            while self._submissions:
+                chunks = []
+                while self._submissions:
+                    data, replies = self._submissions.popleft()
+                    chunks.append(data)
+                    self._pending.extend(replies)
+                self._expecting.set()
+                try:
+                    self._link.write(''.join(chunks))
+                except Exception as error:
+                    self._fail(error)
+                    return
+            if self._closed:
+                return
+            self._submitted.wait()
+
+    def _read_replies(self):
+        while True:
+            self._expecting.clear()
+            while self._pending and not self._closed:
+                reply = self._pending[0]
+                marker = isinstance(reply, _ResyncMarker)
+                if self._markers and not marker:
+                    self._pending.popleft()
+                    reply.set_exception(DeadlineExceededError('Reply abandoned while resynchronizing'))
+                    continue
+                try:
+                    value = self._received.parse_block() if reply.binary else self._received.parse_reply()
+                    if value is None:
+                        if not self._received.receive(self._link, max(4096, self._received.missing)):
+                            raise IOError('Connection closed while waiting for a reply')
+                        continue
+                except ValueError as error:
+                    self._pending.popleft()
+                    reply.set_exception(error)
+                    continue
+                except Exception as error:
+                    self._fail(error)
+                    return
+                if marker and value != self.resync_reply:
+                    self.stale_replies += 1
+                    continue
+                self._pending.popleft()
+                if marker:
+                    with self._markers_lock:
+                        self._markers -= 1
+                reply.set_result(value)
+            if self._closed:
+                return
+            self._expecting.wait()
+
+    def _fail(self, error):
+        if self._error is None:
+            self._error = error
+        while self._submissions:
+            _, replies = self._submissions.popleft()
+            self._pending.extend(replies)
+        while self._pending:
+            self._pending.popleft().set_exception(error)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def get_multiplexed_tcpip_scpi_connection(host, port=5000, timeout=None):
+    link = TcpIpLink(TcpIpAddress(host, port))
+    return MultiplexedScpiConnection(link, timeout=timeout)
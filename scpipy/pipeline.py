@@ -0,0 +1,104 @@
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from Queue import Empty, Full, Queue
+from threading import Event, Thread
+from scpipy.scpi import BufferPool
+
+
+class _Failure(object):
+    def __init__(self, error):
+        self.error = error
+
+
+_END = object()
+
+
+class AcquisitionPipeline(object):
+    def __init__(self, stream, workers=2, processes=False, queue_size=8, pool=None):
+        out = getattr(stream, 'out', None)
+        if out is not None:
+            if processes:
+                raise ValueError('Process workers decode into copies of out; stream without out instead')
+            if not isinstance(out, BufferPool):
+                raise ValueError('Concurrent decodes need a BufferPool as out, not {}'.format(type(out).__name__))
+        self.stream = stream
+        self.workers = workers
+        self.processes = processes
+        self._queue = Queue(queue_size)
+        self._pool = pool
+        self._owns_pool = pool is None
+        self._stopping = Event()
+        self._thread = None
+
+    @property
+    def statistics(self):
+        return self.stream.statistics
+
+    def start(self):
+        if self._pool is None:
+            self._pool = Pool(self.workers) if self.processes else ThreadPool(self.workers)
+        self._thread = Thread(target=self._read)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        self.stream.stop()
+        if self._thread is not None:
+            while self._thread.is_alive():
+                self._drain()
+                self._thread.join(0.01)
+            self._thread = None
+            self._drain()
+            self._queue.put(_END)
+        if self._owns_pool and self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __iter__(self):
+        if self._thread is None:
+            self.start()
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            decoded, timestamp, start_time = item
+            yield self.stream.build(decoded.get(), timestamp, start_time)
+
+    def _read(self):
+        try:
+            for payload, decode, timestamp, start_time in self.stream.readouts():
+                if not self._put((self._pool.apply_async(decode, (payload,)), timestamp, start_time)):
+                    return
+                if self._stopping.is_set():
+                    break
+        except Exception as error:
+            self._put(_Failure(error))
+        else:
+            self._put(_END)
+
+    def _put(self, item):
+        while not self._stopping.is_set():
+            try:
+                self._queue.put(item, timeout=0.01)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _drain(self):
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Empty:
+            pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
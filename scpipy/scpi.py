@@ -1,8 +1,18 @@
 from __future__ import division
 from abc import ABCMeta
+from collections import deque
+from contextlib import contextmanager
 from enum import Enum
-from time import sleep
-from scpipy.links import TcpIpAddress, TcpIpLink
+from functools import partial
+from hashlib import sha1
+import re
+from socket import timeout as socket_timeout
+from string import Formatter
+from threading import Event
+from time import sleep, time
+import numpy as np
+from urlparse import urlparse
+from scpipy.links import LoopbackLink, TcpIpAddress, TcpIpLink, UnixSocketLink
 
 class State(Enum):
     LOW = '0'
@@ -39,12 +49,323 @@ class Edge(Enum):
 class TriggerState(Enum):
     DISABLED = 'TD'
     WAITING = 'WAIT'
-    
-class ScpiConnection(object):
+
+
+class DataFormat(Enum):
+    ASCII = 'ASCII'
+    BINARY = 'BIN'
+
+
+BINARY_SAMPLE_TYPE = np.dtype('>f4')
+
+
+_TRAILING_ZEROS = re.compile(r'\.?0+(?=,|$)')
+
+
+def encode_waveform_data(data):
+    samples = np.asarray(data, dtype=float).ravel()
+    if not len(samples):
+        return ''
+    return _TRAILING_ZEROS.sub('', ','.join(['%.5f'] * len(samples)) % tuple(samples.tolist()))
+
+
+def _decode_into(samples, out):
+    if len(samples) > len(out):
+        raise ValueError('{} samples do not fit in a buffer of {}'.format(len(samples), len(out)))
+    if len(samples) < len(out):
+        out = out[:len(samples)]
+    out[...] = samples
+    return out
+
+
+def decode_ascii_data(reply, out=None):
+    samples = np.fromstring(reply.strip('{}'), sep=',')
+    return samples if out is None else _decode_into(samples, out)
+
+
+def decode_binary_data(payload, out=None):
+    samples = np.frombuffer(payload, dtype=BINARY_SAMPLE_TYPE)
+    return samples.astype(np.float32) if out is None else _decode_into(samples, out)
+
+
+class BufferPool(object):
+    def __init__(self, size=16384, dtype=np.float32, capacity=None):
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.allocated = 0
+        self._free = deque()
+
+    def __len__(self):
+        return len(self._free)
+
+    def acquire(self):
+        try:
+            return self._free.pop()
+        except IndexError:
+            self.allocated += 1
+            return np.empty(self.size, dtype=self.dtype)
+
+    def release(self, buffer):
+        if isinstance(buffer, Acquisition):
+            buffer = buffer.voltages
+        while buffer.base is not None and isinstance(buffer.base, np.ndarray):
+            buffer = buffer.base
+        if buffer.shape != (self.size,) or buffer.dtype != self.dtype:
+            raise ValueError('Buffer does not belong to this pool')
+        if self.capacity is None or len(self._free) < self.capacity:
+            self._free.append(buffer)
+
+
+class Acquisition(object):
+    def __init__(self, voltages, sampling_interval, start_time=0.0, channel=None,
+                 decimation_factor=None, trigger_delay_in_samples=None, timestamp=None):
+        self.voltages = np.asarray(voltages)
+        self.sampling_interval = sampling_interval
+        self.start_time = start_time
+        self.channel = channel
+        self.decimation_factor = decimation_factor
+        self.trigger_delay_in_samples = trigger_delay_in_samples
+        self.timestamp = timestamp
+
+    @property
+    def number_of_samples(self):
+        return self.voltages.shape[-1]
+
+    @property
+    def channels(self):
+        return self.channel if isinstance(self.channel, tuple) else (self.channel,)
+
+    def for_channel(self, channel):
+        if self.voltages.ndim == 1:
+            if channel != self.channel:
+                raise KeyError(channel)
+            return self
+        return Acquisition(self.voltages[self.channels.index(channel)], self.sampling_interval, self.start_time,
+                           channel, self.decimation_factor, self.trigger_delay_in_samples, self.timestamp)
+
+    @property
+    def timebase(self):
+        return self.start_time, self.sampling_interval, self.number_of_samples
+
+    @property
+    def times(self):
+        return self.start_time + self.sampling_interval * np.arange(self.number_of_samples)
+
+    def __len__(self):
+        return self.number_of_samples
+
+    def __iter__(self):
+        yield self.times
+        yield self.voltages
+
+
+class TriggerWindow(object):
+    def __init__(self, start, stop):
+        if stop < start:
+            raise ValueError('Window stop {} is before its start {}'.format(stop, start))
+        self.start = start
+        self.stop = stop
+
+    def offsets(self, sampling_interval):
+        first = int(np.floor(round(self.start / sampling_interval, 6)))
+        last = int(np.ceil(round(self.stop / sampling_interval, 6)))
+        return first, last
+
+    def __repr__(self):
+        return 'TriggerWindow({!r}, {!r})'.format(self.start, self.stop)
+
+
+class PendingReply(object):
+    def __init__(self, connection, binary=False):
+        self._connection = connection
+        self.binary = binary
+        self._value = None
+        self._error = None
+        self._resolved = False
+
+    @property
+    def resolved(self):
+        return self._resolved
+
+    @property
+    def value(self):
+        if not self._resolved:
+            self._connection.resolve(self)
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self._resolved = True
+
+    def fail(self, error):
+        self._error = error
+        self._resolved = True
+
+
+class ReceiveBuffer(object):
     delimiter = '\r\n'
-    
-    def __init__(self, link):
+    error_marker = 'ERR!'
+    block_marker = '#'
+
+    def __init__(self, size=65536):
+        self._buffer = bytearray(size)
+        self._start = 0
+        self._end = 0
+        self._scanned = 0
+        self.missing = 1
+
+    def __len__(self):
+        return self._end - self._start
+
+    def receive(self, link, number_of_bytes=4096):
+        if len(self._buffer) - self._end < number_of_bytes:
+            self._compact(number_of_bytes)
+        received = link.read_into(memoryview(self._buffer)[self._end:])
+        if received:
+            self._end += received
+        return received
+
+    def parse_line(self):
+        index = self._buffer.find(self.delimiter, self._start + self._scanned, self._end)
+        if index < 0:
+            self._scanned = max(0, len(self) - len(self.delimiter) + 1)
+            self.missing = 1
+            return None
+        message = memoryview(self._buffer)[self._start:index].tobytes()
+        self._consume(index + len(self.delimiter) - self._start)
+        return message.replace(self.error_marker, '')
+
+    def parse_block(self):
+        if len(self) < len(self.error_marker) and self.error_marker.startswith(bytes(self._buffer[self._start:self._end])):
+            return self._need(len(self.error_marker))
+        if self._buffer.startswith(self.error_marker, self._start, self._end):
+            self._consume(len(self.error_marker))
+        if len(self) < 2:
+            return self._need(2)
+        if self._buffer[self._start] != ord(self.block_marker):
+            line = self.parse_line()
+            if line is None:
+                return None
+            raise ValueError('Expected a binary block, received {!r}'.format(line[:16]))
+        header_length = 2 + int(chr(self._buffer[self._start + 1]))
+        if len(self) < header_length:
+            return self._need(header_length)
+        length = int(bytes(self._buffer[self._start + 2:self._start + header_length]))
+        size = header_length + length + len(self.delimiter)
+        if len(self) < size:
+            return self._need(size)
+        payload_start = self._start + header_length
+        payload = memoryview(self._buffer)[payload_start:payload_start + length].tobytes()
+        self._consume(size)
+        return payload
+
+    def parse_reply(self):
+        start = self._start
+        if self._buffer.startswith(self.error_marker, start, self._end):
+            start += len(self.error_marker)
+        elif len(self) < len(self.error_marker) and self.error_marker.startswith(bytes(self._buffer[start:self._end])):
+            return self._need(len(self.error_marker))
+        if start == self._end:
+            return self._need(start - self._start + 1)
+        if self._buffer[start] == ord(self.block_marker):
+            return self.parse_block()
+        return self.parse_line()
+
+    def _need(self, size):
+        self.missing = size - len(self)
+        return None
+
+    def _compact(self, number_of_bytes):
+        pending = len(self)
+        buffer = self._buffer
+        if len(buffer) - pending < number_of_bytes:
+            buffer = bytearray(max(2 * len(buffer), pending + number_of_bytes))
+        buffer[:pending] = self._buffer[self._start:self._end]
+        self._buffer = buffer
+        self._start = 0
+        self._end = pending
+
+    def _consume(self, number_of_bytes):
+        self._start += number_of_bytes
+        self._scanned = 0
+        if self._start == self._end:
+            self._start = self._end = 0
+
+
+def _compile_template(format_string, enum_fields):
+    if not any(enum_fields):
+        return lambda *arguments: format_string % arguments
+    if enum_fields == [True]:
+        return lambda argument: format_string % (argument._value_,)
+    if enum_fields == [True, True]:
+        return lambda first, second: format_string % (first._value_, second._value_)
+    if enum_fields == [True, False]:
+        return lambda first, second: format_string % (first._value_, second)
+    if enum_fields == [False, True]:
+        return lambda first, second: format_string % (first, second._value_)
+
+    def format_arguments(*arguments):
+        return format_string % tuple([argument._value_ if enum else argument
+                                      for argument, enum in zip(arguments, enum_fields)])
+    return format_arguments
+
+
+class CommandTemplate(object):
+    delimiter = ReceiveBuffer.delimiter
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        parts = []
+        enum_fields = []
+        for literal, field, specification, conversion in Formatter().parse(pattern):
+            parts.append(literal.replace('%', '%%'))
+            if field is None:
+                continue
+            if field not in ('', '.value') or specification or conversion:
+                raise ValueError('Unsupported field {{{}}} in command template {!r}'.format(field, pattern))
+            parts.append('%s')
+            enum_fields.append(bool(field))
+        format_string = ''.join(parts)
+        self.format = _compile_template(format_string, enum_fields)
+        self.encode = _compile_template(format_string + self.delimiter, enum_fields)
+
+    def __call__(self, *arguments):
+        return self.format(*arguments)
+
+    def __repr__(self):
+        return 'CommandTemplate({!r})'.format(self.pattern)
+
+
+class DeadlineExceededError(IOError):
+    pass
+
+
+class ScpiConnection(object):
+    delimiter = ReceiveBuffer.delimiter
+    resync_query = '*IDN?'
+    resync_reply = 'REDPITAYA,INSTR2014,0,01-02'
+
+    def __init__(self, link, buffer_size=65536, instrumentation=None, latency_budget=None):
         self._link = link
+        self.latency_budget = latency_budget
+        self.stale_replies = 0
+        self._deadline = None
+        self._abandoned = 0
+        self._resync_markers = 0
+        self._received = ReceiveBuffer(buffer_size)
+        self._pending_writes = []
+        self._pending_replies = deque()
+        self._batch_depth = 0
+        self.instrumentation = instrumentation
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.chunks_received = 0
+        self._traced_queries = deque()
+        self._chunk_mark = 0
 
     def open(self):
         self._link.open()
@@ -52,17 +373,203 @@ class ScpiConnection(object):
     def close(self):
         self._link.close()
 
-    def write(self, message):
-        return self._link.write(message + self.delimiter) - len(self.delimiter)
+    @contextmanager
+    def deadline(self, timeout):
+        previous = self._deadline
+        self._deadline = self._get_deadline(timeout)
+        try:
+            yield self
+        finally:
+            self._deadline = previous
+
+    def write(self, message, timeout=None):
+        if self.instrumentation is not None:
+            record = self.instrumentation.start(message, len(message) + len(self.delimiter))
+            written = self._write(message, timeout)
+            self._trace(record)
+            return written
+        return self._write(message, timeout)
+
+    def write_encoded(self, data):
+        if self.instrumentation is not None or self._batch_depth:
+            return self.write(data[:-len(self.delimiter)])
+        self.bytes_sent += len(data)
+        if self._abandoned or self._deadline is not None or self.latency_budget is not None:
+            return self._send(data, self._get_deadline()) - len(self.delimiter)
+        return self._link.write(data) - len(self.delimiter)
+
+    def _write(self, message, timeout=None):
+        if self._batch_depth:
+            self._pending_writes.append(message)
+            return len(message)
+        data = message + self.delimiter
+        self.bytes_sent += len(data)
+        return self._send(data, self._get_deadline(timeout)) - len(self.delimiter)
+
+    def flush(self):
+        if not self._pending_writes:
+            return 0
+        self._pending_writes.append('')
+        data = self.delimiter.join(self._pending_writes)
+        del self._pending_writes[:]
+        self.bytes_sent += len(data)
+        return self._send(data, self._get_deadline())
+
+    def _send(self, data, deadline):
+        if self._abandoned:
+            self._resynchronize(deadline)
+        return self._transmit(data, deadline)
+
+    def _transmit(self, data, deadline):
+        if deadline is None:
+            return self._link.write(data)
+        with self._link_deadline(deadline):
+            return self._link.write(data)
+
+    def _resynchronize(self, deadline):
+        marker = self.resync_query + self.delimiter
+        self.bytes_sent += len(marker)
+        self._transmit(marker, deadline)
+        self._resync_markers += 1
+        while self._resync_markers:
+            if self._parse_reply(None, 4096, deadline) == self.resync_reply:
+                self._resync_markers -= 1
+            else:
+                self.stale_replies += 1
+        self._abandoned = 0
+
+    @contextmanager
+    def batch(self):
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+
+    def send_query(self, message, binary=False):
+        self.write(message)
+        reply = PendingReply(self, binary)
+        self._pending_replies.append(reply)
+        return reply
+
+    def resolve(self, reply=None, timeout=None):
+        self._resolve(reply, self._get_deadline(timeout))
+
+    def _resolve(self, reply, deadline):
+        self.flush()
+        while self._pending_replies:
+            pending_reply = self._pending_replies.popleft()
+            try:
+                if pending_reply.binary:
+                    pending_reply.value = self._read_block(deadline=deadline)
+                else:
+                    pending_reply.value = self._read_line(deadline=deadline)
+            except DeadlineExceededError as error:
+                pending_reply.fail(error)
+                self._abandon_pending_replies(error)
+                raise
+            if pending_reply is reply:
+                break
 
-    def read(self, number_of_bytes=4096):
-        message = ''
+    def read(self, number_of_bytes=4096, timeout=None):
+        deadline = self._get_deadline(timeout)
+        self._resolve(None, deadline)
+        return self._read_line(number_of_bytes, deadline)
+
+    def read_block(self, number_of_bytes=4096, timeout=None):
+        deadline = self._get_deadline(timeout)
+        self._resolve(None, deadline)
+        return self._read_block(number_of_bytes, deadline)
+
+    def _read_line(self, number_of_bytes=4096, deadline=None):
+        message = self._read_reply(False, number_of_bytes, deadline)
+        if self._traced_queries:
+            self._finish_trace(len(message) + len(self.delimiter))
+        return message
+
+    def _read_block(self, number_of_bytes=4096, deadline=None):
+        payload = self._read_reply(True, number_of_bytes, deadline)
+        if self._traced_queries:
+            self._finish_trace(len(payload) + len(str(len(payload))) + 2 + len(self.delimiter))
+        return payload
+
+    def _read_reply(self, binary, number_of_bytes, deadline):
+        try:
+            return self._parse_reply(binary, number_of_bytes, deadline)
+        except DeadlineExceededError:
+            self._abandon()
+            raise
+        except ValueError:
+            if self._traced_queries:
+                self._traced_queries.popleft()
+            raise
+
+    def _parse_reply(self, binary, number_of_bytes, deadline):
         while True:
-            chunk = self._link.read(number_of_bytes).replace('ERR!', '')
-            message += chunk
-            if message.endswith(self.delimiter):
-                break
-        return message.rstrip(self.delimiter)
+            if binary is None:
+                reply = self._received.parse_reply()
+            else:
+                reply = self._received.parse_block() if binary else self._received.parse_line()
+            if reply is not None:
+                return reply
+            self._receive(max(number_of_bytes, self._received.missing), deadline)
+
+    def _receive(self, number_of_bytes, deadline=None):
+        if deadline is None:
+            received = self._received.receive(self._link, number_of_bytes)
+        else:
+            with self._link_deadline(deadline):
+                received = self._received.receive(self._link, number_of_bytes)
+        if not received:
+            raise IOError('Connection closed while waiting for a reply')
+        self.bytes_received += received
+        self.chunks_received += 1
+
+    def _get_deadline(self, timeout=None):
+        if timeout is None:
+            timeout = self.latency_budget
+        if timeout is None:
+            return self._deadline
+        deadline = time() + timeout
+        return deadline if self._deadline is None else min(deadline, self._deadline)
+
+    @contextmanager
+    def _link_deadline(self, deadline):
+        remaining = deadline - time()
+        if remaining <= 0:
+            raise DeadlineExceededError('Deadline exceeded before the link was ready')
+        self._link.set_timeout(remaining)
+        try:
+            yield
+        except socket_timeout:
+            raise DeadlineExceededError('Deadline exceeded after {:.6f} s'.format(remaining))
+        finally:
+            self._link.set_timeout(self._link.timeout)
+
+    def _abandon(self):
+        self._abandoned += 1
+        if self._traced_queries:
+            self._traced_queries.popleft()
+
+    def _abandon_pending_replies(self, error):
+        while self._pending_replies:
+            self._pending_replies.popleft().fail(error)
+            self._abandon()
+
+    def _trace(self, record):
+        if record.is_query:
+            self._traced_queries.append((record, self.chunks_received))
+        else:
+            self.instrumentation.finish(record)
+
+    def _finish_trace(self, bytes_received):
+        record, chunk_mark = self._traced_queries.popleft()
+        chunks = self.chunks_received - max(chunk_mark, self._chunk_mark)
+        self._chunk_mark = self.chunks_received
+        if self.instrumentation is not None:
+            self.instrumentation.finish(record, bytes_received, chunks)
 
     def __enter__(self):
         self.open()
@@ -72,67 +579,187 @@ class ScpiConnection(object):
         self.close()
 
 
-def get_tcpip_scpi_connection(host, port=5000, timeout=None, alt_socket=None):
-    link = TcpIpLink(TcpIpAddress(host, port))
+def get_tcpip_scpi_connection(host, port=5000, timeout=None, alt_socket=None, no_delay=True,
+                              receive_buffer_size=262144, send_buffer_size=None):
+    link = TcpIpLink(TcpIpAddress(host, port), timeout, alt_socket, no_delay, receive_buffer_size,
+                     send_buffer_size)
     return ScpiConnection(link)
 
+
+def get_scpi_link(url, timeout=None, serve=None, **options):
+    if '://' not in url:
+        url = 'tcp://' + url
+    parsed = urlparse(url)
+    if parsed.scheme == 'tcp':
+        return TcpIpLink(TcpIpAddress(parsed.hostname, parsed.port or 5000), timeout, **options)
+    if parsed.scheme == 'unix':
+        return UnixSocketLink(parsed.netloc + parsed.path, timeout, **options)
+    if parsed.scheme == 'loopback':
+        if serve is None:
+            raise ValueError('A loopback link needs a serve function to talk to')
+        return LoopbackLink(serve, timeout, **options)
+    raise ValueError('Unsupported SCPI link URL {!r}'.format(url))
+
+
+def get_scpi_connection(url, timeout=None, serve=None, **options):
+    return ScpiConnection(get_scpi_link(url, timeout, serve, **options))
+
+
+class SettingsCache(object):
+    _missing = object()
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._values = {}
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def changes(self, key, value):
+        return self._values.get(key, self._missing) != value
+
+    def update(self, key, value):
+        if self.enabled:
+            self._values[key] = value
+
+    def invalidate(self, *keys):
+        if not keys:
+            self._values.clear()
+        for key in keys:
+            self._values.pop(key, None)
+
+
+@contextmanager
+def _unbounded():
+    yield
+
+
 class ScpiControlledInterface(object):
     __metaclass__ = ABCMeta
 
-    def __init__(self, connection):
+    def __init__(self, connection, cache=False):
         self._connection = connection
-
-    def command(self, message):
-        self._connection.write(message)
-
-    def query(self, message):
-        self._connection.write(message)
-        return self._connection.read()
+        self._cache = SettingsCache(enabled=cache)
+        write_encoded = getattr(connection, 'write_encoded', None)
+        if write_encoded is not None:
+            self._send_encoded = write_encoded
+
+    def command(self, message, timeout=None):
+        with self._deadline(timeout):
+            self._connection.write(message)
+
+    def _send_encoded(self, data):
+        self.command(data[:-len(CommandTemplate.delimiter)])
+
+    def query(self, message, timeout=None):
+        with self._deadline(timeout):
+            self._connection.write(message)
+            return self._connection.read()
+
+    def query_block(self, message, timeout=None):
+        with self._deadline(timeout):
+            self._connection.write(message)
+            return self._connection.read_block()
+
+    def _deadline(self, timeout):
+        if timeout is None:
+            timeout = getattr(self._connection, 'latency_budget', None)
+        if timeout is None:
+            return _unbounded()
+        return self._connection.deadline(timeout)
+
+    def _query_value(self, message, convert):
+        return convert(self.query(message))
+
+    def _query_block_value(self, message, convert):
+        return convert(self.query_block(message))
+
+    def _query_values(self, messages, convert, binary=False):
+        with self._connection.batch():
+            replies = [self._connection.send_query(message, binary) for message in messages]
+        return [convert(reply.value) for reply in replies]
+
+    def _command_setting(self, key, value, data):
+        if self._cache.changes(key, value):
+            self._send_encoded(data)
+            self._cache.update(key, value)
+
+    def _query_setting(self, key, message, convert):
+        if key in self._cache:
+            return self._cache.get(key)
+        value = self._query_value(message, convert)
+        self._cache.update(key, value)
+        return value
+
+    def refresh(self):
+        self._cache.invalidate()
 
 
 class DigitalController(ScpiControlledInterface):
+    SET_STATE = CommandTemplate('DIG:PIN {},{.value}')
+    SET_DIRECTION = CommandTemplate('DIG:PIN:DIR {.value},{}')
+    GET_STATE = CommandTemplate('DIG:PIN? {}')
+
     def __init__(self, connection):
         ScpiControlledInterface.__init__(self, connection)
 
     def set_state(self, pin, state):
-        self.command('DIG:PIN {},{}'.format(pin, state.value))
+        self._send_encoded(self.SET_STATE.encode(pin, state))
 
     def set_direction(self, pin, direction):
-        self.command('DIG:PIN:DIR {},{}'.format(direction.value, pin))
+        self._send_encoded(self.SET_DIRECTION.encode(direction, pin))
 
     def get_state(self, pin):
-        return State(self.query('DIG:PIN? {}'.format(pin)))
+        return self._query_value(self.GET_STATE.format(pin), State)
 
 
 class AnalogController(ScpiControlledInterface):
+    GET_ANALOG_INPUT = CommandTemplate('ANALOG:PIN? {}')
+    SET_ANALOG_OUTPUT = CommandTemplate('ANALOG:PIN {},{}')
+
     def __init__(self, connection):
         ScpiControlledInterface.__init__(self, connection)
         
     def get_analog_input(self, pin):
-        return float(self.query('ANALOG:PIN? {}'.format(pin)))
+        return self._query_value(self.GET_ANALOG_INPUT.format(pin), float)
 
     def set_analog_output(self, pin, value):
-        self.command('ANALOG:PIN {},{}'.format(pin, str(value)))
+        self._send_encoded(self.SET_ANALOG_OUTPUT.encode(pin, value))
 
 
 class Generator(ScpiControlledInterface):
-    def __init__(self, connection):
-        ScpiControlledInterface.__init__(self, connection)
+    SET_WAVEFORM = CommandTemplate('SOUR{}:FUNC {.value}')
+    SET_FREQUENCY = CommandTemplate('SOUR{}:FREQ:FIX {}')
+    SET_AMPLITUDE = CommandTemplate('SOUR{}:VOLT {}')
+    SET_OUTPUT_STATE = CommandTemplate('OUTPUT{}:STATE {}')
+    SET_BURST_STATE = CommandTemplate('SOUR{}:BURS:STAT {}')
+    SET_BURST_COUNT = CommandTemplate('SOUR{}:BURS:NCYC {}')
+    SET_BURST_REPETITIONS = CommandTemplate('SOUR{}:BURS:NOR {}')
+    SET_BURST_PERIOD = CommandTemplate('SOUR{}:BURS:INT:PER {}')
+    TRIGGER_IMMEDIATELY = CommandTemplate('SOUR{}:TRIG:IMM')
+    SET_ARBITRARY_WAVEFORM_DATA = CommandTemplate('SOUR{}:TRAC:DATA:DATA {}')
+
+    def __init__(self, connection, cache=False):
+        ScpiControlledInterface.__init__(self, connection, cache)
 
     def reset(self):
         self.command('GEN:RST')
+        self._cache.invalidate()
 
     def set_waveform(self, channel, waveform=Waveform.SINE):
-        self.command('SOUR{}:FUNC {}'.format(channel, waveform.value))
+        self._command_setting(('waveform', channel), waveform, self.SET_WAVEFORM.encode(channel, waveform))
 
     def set_frequency(self, channel, frequency=1000):
-        self.command('SOUR{}:FREQ:FIX {}'.format(channel, frequency))
+        self._command_setting(('frequency', channel), frequency, self.SET_FREQUENCY.encode(channel, frequency))
 
     def set_amplitude(self, channel, amplitude=1):
-        self.command('SOUR{}:VOLT {}'.format(channel, amplitude))
+        self._command_setting(('amplitude', channel), amplitude, self.SET_AMPLITUDE.encode(channel, amplitude))
 
     def _set_output_state(self, channel, state):
-        self.command('OUTPUT{}:STATE {}'.format(channel, state))
+        self._send_encoded(self.SET_OUTPUT_STATE.encode(channel, state))
         
     def enable_output(self, channel):
         self._set_output_state(channel, 'ON')
@@ -141,7 +768,7 @@ class Generator(ScpiControlledInterface):
         self._set_output_state(channel, 'OFF')
 
     def _set_gen_mode(self, channel, burst):
-        self.command('SOUR{}:BURS:STAT {}'.format(channel, burst))
+        self._command_setting(('burst', channel), burst, self.SET_BURST_STATE.encode(channel, burst))
 
     def enable_burst(self, channel):
         self._set_gen_mode(channel, 'ON')
@@ -150,32 +777,166 @@ class Generator(ScpiControlledInterface):
         self._set_gen_mode(channel, 'OFF')
 
     def set_burst_count(self, channel, count=1):
-        self.command('SOUR{}:BURS:NCYC {}'.format(channel, count))
+        self._command_setting(('burst_count', channel), count, self.SET_BURST_COUNT.encode(channel, count))
 
     def set_burst_repetitions(self, channel, repetitions=1):
-        self.command('SOUR{}:BURS:NOR {}'.format(channel, repetitions))
+        self._command_setting(('burst_repetitions', channel), repetitions,
+                              self.SET_BURST_REPETITIONS.encode(channel, repetitions))
 
     def set_burst_period(self, channel, period_in_us):
-        self.command('SOUR{}:BURS:INT:PER {}'.format(channel, period_in_us))
+        self._command_setting(('burst_period', channel), period_in_us,
+                              self.SET_BURST_PERIOD.encode(channel, period_in_us))
 
     def trigger_immediately(self, channel):
-        self.command('SOUR{}:TRIG:IMM'.format(channel))
+        self._send_encoded(self.TRIGGER_IMMEDIATELY.encode(channel))
 
     def set_arbitrary_waveform_data(self, channel, data):
-        self.command('SOUR{}:TRAC:DATA:DATA {}'.format(channel, ','.join('{:1.5f}'.format(value).rstrip('0').rstrip('.')
-                                                                         for value
-                                                                         in data)))
+        samples = np.asarray(data, dtype=float).ravel()
+        key = ('arbitrary_waveform', channel)
+        fingerprint = sha1(samples.tobytes()).hexdigest() if self._cache.enabled else None
+        if fingerprint is not None and not self._cache.changes(key, fingerprint):
+            return
+        self._send_encoded(self.SET_ARBITRARY_WAVEFORM_DATA.encode(channel, encode_waveform_data(samples)))
+        self._cache.update(key, fingerprint)
+
+
+class TriggerTimeoutError(Exception):
+    pass
+
+
+class TriggerStatistics(object):
+    def __init__(self):
+        self.triggers = 0
+        self.timeouts = 0
+        self.polls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_detection_latency = 0.0
+        self.max_detection_latency = 0.0
+        self.readouts = 0
+        self.total_readout_latency = 0.0
+        self.max_readout_latency = 0.0
+
+    def record_trigger(self, wait, polls, detection_latency):
+        self.triggers += 1
+        self.polls += polls
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.total_detection_latency += detection_latency
+        self.max_detection_latency = max(self.max_detection_latency, detection_latency)
+
+    def record_readout(self, readout_latency):
+        self.readouts += 1
+        self.total_readout_latency += readout_latency
+        self.max_readout_latency = max(self.max_readout_latency, readout_latency)
+
+    @property
+    def mean_wait(self):
+        return self.total_wait / self.triggers if self.triggers else 0.0
+
+    @property
+    def mean_trigger_to_readout(self):
+        detection = self.total_detection_latency / self.triggers if self.triggers else 0.0
+        readout = self.total_readout_latency / self.readouts if self.readouts else 0.0
+        return detection + readout
+
+
+class TriggerWait(object):
+    stop_check_interval = 0.05
+
+    def __init__(self, timeout=None, min_interval=0.0001, max_interval=0.01, backoff=1.5, notify=None):
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.notify = notify
+        self.statistics = TriggerStatistics()
+
+    def poll_interval(self, buffer_duration):
+        return min(self.max_interval, max(self.min_interval, buffer_duration / 8))
+
+    def wait(self, oscilloscope, buffer_duration, timeout=None, stop=None):
+        if timeout is None:
+            timeout = self.timeout
+        start = time()
+        if self.notify is not None:
+            return self._wait_for_notification(oscilloscope, start, timeout, stop)
+
+        deadline = None if timeout is None else start + timeout
+        interval = self.poll_interval(buffer_duration)
+        polls = 0
+        last_waiting = start
+        while True:
+            polls += 1
+            if oscilloscope.get_trigger_state() == TriggerState.DISABLED:
+                break
+            last_waiting = time()
+            if deadline is not None and last_waiting >= deadline:
+                self._timed_out(timeout)
+            delay = interval if deadline is None else min(interval, deadline - last_waiting)
+            if stop is None:
+                sleep(delay)
+            elif stop.wait(delay):
+                return None
+            interval = min(self.max_interval, interval * self.backoff)
+        detected_at = time()
+        self.statistics.record_trigger(detected_at - start, polls, detected_at - last_waiting)
+        return detected_at
+
+    def record_readout(self, detected_at, timestamp):
+        self.statistics.record_readout(timestamp - detected_at)
+
+    def _wait_for_notification(self, oscilloscope, start, timeout, stop=None):
+        if stop is None:
+            if not self.notify(oscilloscope, timeout):
+                self._timed_out(timeout)
+        else:
+            deadline = None if timeout is None else start + timeout
+            while True:
+                remaining = None if deadline is None else deadline - time()
+                if remaining is not None and remaining <= 0:
+                    self._timed_out(timeout)
+                if self.notify(oscilloscope, self.stop_check_interval if remaining is None
+                               else min(self.stop_check_interval, remaining)):
+                    break
+                if stop.is_set():
+                    return None
+        detected_at = time()
+        self.statistics.record_trigger(detected_at - start, 0, 0.0)
+        return detected_at
+
+    def _timed_out(self, timeout):
+        self.statistics.timeouts += 1
+        raise TriggerTimeoutError('No trigger within {} s'.format(timeout))
 
 
 class Oscilloscope(ScpiControlledInterface):
-
-    def __init__(self, connection, base_sampling_rate=int(125e6), buffer_size=16384):
-        ScpiControlledInterface.__init__(self, connection)
+    SET_DECIMATION_FACTOR = CommandTemplate('ACQ:DEC {}')
+    SET_AVERAGING_STATE = CommandTemplate('ACQ:AVG {}')
+    SET_TRIGGER_EVENT = CommandTemplate('ACQ:TRIG {.value}_{.value}')
+    SET_TRIGGER_LEVEL = CommandTemplate('ACQ:TRIG:LEV {}')
+    SET_TRIGGER_DELAY_IN_SAMPLES = CommandTemplate('ACQ:TRIG:DLY {}')
+    SET_TRIGGER_DELAY_IN_NS = CommandTemplate('ACQ:TRIG:DLY:NS {}')
+    SET_DATA_FORMAT = CommandTemplate('ACQ:DATA:FORMAT {.value}')
+    GET_DATA_BETWEEN = CommandTemplate('DATA:STA:END? {},{}')
+    GET_OLDEST_DATA = CommandTemplate('DATA:OLD:N? {}')
+    GET_LATEST_DATA = CommandTemplate('DATA:LAT:N? {}')
+    SOURCE_QUERY = CommandTemplate('ACQ:SOUR{}:{}')
+    confirmation_timeout = 1.0
+
+    def __init__(self, connection, base_sampling_rate=int(125e6), buffer_size=16384, trigger_wait=None,
+                 cache=False):
+        ScpiControlledInterface.__init__(self, connection, cache)
         self._base_sampling_rate = base_sampling_rate
         self._buffer_size = buffer_size
+        self._data_format = DataFormat.ASCII
+        self.trigger_wait = trigger_wait or TriggerWait()
+
+    def _buffer_duration(self, decimation_factor):
+        return self._buffer_size / self._base_sampling_rate * decimation_factor
 
     def _wait_for_buffer_cleaning(self):
-        sleep(self._buffer_size / self._base_sampling_rate * self.get_decimation_factor())
+        sleep(self._buffer_duration(self.get_decimation_factor()))
 
     def start(self):
         self.command('ACQ:START')
@@ -186,18 +947,33 @@ class Oscilloscope(ScpiControlledInterface):
 
     def reset(self):
         self.command('ACQ:RST')
-
-    def set_decimation_factor(self, factor = 1):
-        self.command('ACQ:DEC {}'.format(factor))
+        self._cache.invalidate()
+        self._data_format = DataFormat.ASCII
+
+    def refresh(self):
+        self._cache.invalidate()
+        self.get_decimation_factor()
+        self.get_trigger_level()
+        self.get_trigger_delay_in_samples()
+
+    def set_decimation_factor(self, factor = 1, timeout=None):
+        if not self._cache.changes('decimation_factor', factor):
+            return
+        self._send_encoded(self.SET_DECIMATION_FACTOR.encode(factor))
+        deadline = time() + (self.confirmation_timeout if timeout is None else timeout)
         while True:
-            if self.get_decimation_factor() == factor:
+            if self._query_value('ACQ:DEC?', int) == factor:
                 break
+            if time() >= deadline:
+                raise DeadlineExceededError('Decimation factor {} was not confirmed in time'.format(factor))
+        self._cache.update('decimation_factor', factor)
+        self._cache.invalidate('trigger_delay_in_ns')
 
     def get_decimation_factor(self):
-        return int(self.query('ACQ:DEC?'))
+        return self._query_setting('decimation_factor', 'ACQ:DEC?', int)
 
     def _set_averaging_state(self, state):
-        self.command('ACQ:AVG {}'.format(state))
+        self._command_setting('averaging', state, self.SET_AVERAGING_STATE.encode(state))
 
     def enable_averaging(self):
         self._set_averaging_state('ON')
@@ -212,40 +988,235 @@ class Oscilloscope(ScpiControlledInterface):
         self.command('ACQ:TRIG NOW')
 
     def set_trigger_event(self, source, edge):
-        self.command('ACQ:TRIG {}_{}'.format(source.value, edge.value))
+        self._send_encoded(self.SET_TRIGGER_EVENT.encode(source, edge))
 
     def set_trigger_level(self, voltage):
-        self.command('ACQ:TRIG:LEV {}'.format(voltage))
+        self._command_setting('trigger_level', voltage, self.SET_TRIGGER_LEVEL.encode(voltage))
 
     def get_trigger_level(self):
-        return int(self.query('ACQ:TRIG:LEV?'))
+        return self._query_setting('trigger_level', 'ACQ:TRIG:LEV?', int)
 
     def set_trigger_delay_in_samples(self, number_of_samples):
-        self.command('ACQ:TRIG:DLY {}'.format(number_of_samples))
+        if self._cache.changes('trigger_delay_in_samples', number_of_samples):
+            self._cache.invalidate('trigger_delay_in_ns')
+        self._command_setting('trigger_delay_in_samples', number_of_samples,
+                              self.SET_TRIGGER_DELAY_IN_SAMPLES.encode(number_of_samples))
 
     def get_trigger_delay_in_samples(self):
-        return int(self.query('ACQ:TRIG:DLY?'))
+        return self._query_setting('trigger_delay_in_samples', 'ACQ:TRIG:DLY?', int)
 
     def set_trigger_delay_in_ns(self, delay_in_ns):
-        self.command('ACQ:TRIG:DLY:NS {}'.format(delay_in_ns))
+        if self._cache.changes('trigger_delay_in_ns', delay_in_ns):
+            self._cache.invalidate('trigger_delay_in_samples')
+        self._command_setting('trigger_delay_in_ns', delay_in_ns, self.SET_TRIGGER_DELAY_IN_NS.encode(delay_in_ns))
 
     def get_trigger_delay_in_ns(self):
-        return int(self.query('ACQ:TRIG:DLY:NS?'))
+        return self._query_setting('trigger_delay_in_ns', 'ACQ:TRIG:DLY:NS?', int)
         
     def get_trigger_state(self):
-        return TriggerState(self.query('ACQ:TRIG:STAT?'))
-
-    def get_data(self, channel):
-        raw_data = self.query('ACQ:SOUR{}:DATA?'.format(channel))
-        return [float(datapoint) for datapoint in raw_data.strip('{}').split(',')]
-
-    def get_acquisition(self, channel):
-        while True:
-            if self.get_trigger_state() == TriggerState.DISABLED:
-                break
-            sleep(0.001)
-        voltages = self.get_data(channel)
-
+        return self._query_value('ACQ:TRIG:STAT?', TriggerState)
+
+    def set_data_format(self, data_format):
+        self._send_encoded(self.SET_DATA_FORMAT.encode(data_format))
+        self._data_format = data_format
+
+    def get_data_format(self):
+        return self._data_format
+
+    def get_trigger_position(self):
+        return self._query_value('ACQ:TPOS?', int)
+
+    def get_write_position(self):
+        return self._query_value('ACQ:WPOS?', int)
+
+    def get_data(self, channel, out=None):
+        return self._read_data(channel, 'DATA?', out)
+
+    def get_data_between(self, channel, start, end, out=None):
+        return self._read_data(channel, self.GET_DATA_BETWEEN.format(start, end), out)
+
+    def get_oldest_data(self, channel, number_of_samples, out=None):
+        return self._read_data(channel, self.GET_OLDEST_DATA.format(number_of_samples), out)
+
+    def get_latest_data(self, channel, number_of_samples, out=None):
+        return self._read_data(channel, self.GET_LATEST_DATA.format(number_of_samples), out)
+
+    def _read_data(self, channel, query, out=None):
+        if self._data_format == DataFormat.BINARY or out is not None:
+            return self._get_voltages(channel, query, out)
+        return self._get_voltages(channel, query).tolist()
+
+    def _get_voltages(self, channel, query='DATA?', out=None):
+        message = self.SOURCE_QUERY.format(channel, query)
+        if self._data_format == DataFormat.BINARY:
+            return self._query_block_value(message, self._decoder(decode_binary_data, out))
+        return self._query_value(message, self._decoder(decode_ascii_data, out))
+
+    def _query_raw_voltages(self, channel, query='DATA?', out=None):
+        message = self.SOURCE_QUERY.format(channel, query)
+        if self._data_format == DataFormat.BINARY:
+            return self.query_block(message), self._decoder(decode_binary_data, out)
+        return self.query(message), self._decoder(decode_ascii_data, out)
+
+    @staticmethod
+    def _decoder(decode, out):
+        if out is None:
+            return decode
+        if isinstance(out, BufferPool):
+            out = out.acquire()
+        return partial(decode, out=out)
+
+    def _get_channels_voltages(self, channels, query='DATA?'):
+        messages = [self.SOURCE_QUERY.format(channel, query) for channel in channels]
+        if self._data_format == DataFormat.BINARY:
+            return self._query_values(messages, decode_binary_data, binary=True)
+        return self._query_values(messages, decode_ascii_data)
+
+    def _window_query(self, window, decimation_factor, trigger_position):
+        first, last = window.offsets(decimation_factor / self._base_sampling_rate)
+        if last - first + 1 > self._buffer_size:
+            raise ValueError('{!r} is longer than the acquisition buffer'.format(window))
+        start = (trigger_position + first) % self._buffer_size
+        end = (trigger_position + last) % self._buffer_size
+        return self.GET_DATA_BETWEEN.format(start, end), first * decimation_factor / self._base_sampling_rate
+
+    def _get_window_voltages(self, channel, window, decimation_factor, out=None):
+        query, start_time = self._window_query(window, decimation_factor, self.get_trigger_position())
+        return self._get_voltages(channel, query, out), start_time
+
+    def wait_for_trigger(self, timeout=None, decimation_factor=None, stop=None):
+        if decimation_factor is None:
+            decimation_factor = self.get_decimation_factor()
+        return self.trigger_wait.wait(self, self._buffer_duration(decimation_factor), timeout, stop)
+
+    def get_acquisition(self, channel, timeout=None, window=None, out=None):
+        decimation_factor = self.get_decimation_factor()
+        detected_at = self.wait_for_trigger(timeout, decimation_factor)
+        if window is None:
+            voltages, start_time = self._get_voltages(channel, out=out), 0.0
+        else:
+            voltages, start_time = self._get_window_voltages(channel, window, decimation_factor, out)
+        timestamp = time()
+        self.trigger_wait.record_readout(detected_at, timestamp)
+        return self._build_acquisition(channel, voltages, decimation_factor,
+                                       self._cache.get('trigger_delay_in_samples'), timestamp, start_time)
+
+    def get_acquisitions(self, channels=(1, 2), timeout=None, window=None):
+        channels = tuple(channels)
         decimation_factor = self.get_decimation_factor()
-        times = [i / self._base_sampling_rate * decimation_factor for i in range(len(voltages))]
-        return times, voltages
+        detected_at = self.wait_for_trigger(timeout, decimation_factor)
+        if window is None:
+            query, start_time = 'DATA?', 0.0
+        else:
+            query, start_time = self._window_query(window, decimation_factor, self.get_trigger_position())
+        voltages = np.vstack(self._get_channels_voltages(channels, query))
+        timestamp = time()
+        self.trigger_wait.record_readout(detected_at, timestamp)
+        return self._build_acquisition(channels, voltages, decimation_factor,
+                                       self._cache.get('trigger_delay_in_samples'), timestamp, start_time)
+
+    def stream(self, channel, trigger_source=None, edge=Edge.POSITIVE, count=None, period=None, timeout=None,
+               window=None, out=None):
+        return AcquisitionStream(self, channel, trigger_source, edge, count, period, timeout, window, out)
+
+    def _build_acquisition(self, channel, voltages, decimation_factor, trigger_delay_in_samples, timestamp,
+                           start_time=0.0):
+        return Acquisition(voltages,
+                           sampling_interval=decimation_factor / self._base_sampling_rate,
+                           start_time=start_time,
+                           channel=channel,
+                           decimation_factor=decimation_factor,
+                           trigger_delay_in_samples=trigger_delay_in_samples,
+                           timestamp=timestamp)
+
+
+class StreamStatistics(object):
+    def __init__(self):
+        self.acquired = 0
+        self.dropped = 0
+        self.late = 0
+        self.started = None
+        self.last_timestamp = None
+
+    @property
+    def rate(self):
+        if not self.acquired or self.last_timestamp == self.started:
+            return 0.0
+        return self.acquired / (self.last_timestamp - self.started)
+
+
+class AcquisitionStream(object):
+    def __init__(self, oscilloscope, channel, trigger_source=None, edge=Edge.POSITIVE, count=None, period=None,
+                 timeout=None, window=None, out=None):
+        self._oscilloscope = oscilloscope
+        self.channel = channel
+        self.trigger_source = trigger_source
+        self.edge = edge
+        self.count = count
+        self.period = period
+        self.timeout = timeout
+        self.window = window
+        self.out = out
+        self.statistics = StreamStatistics()
+        self.decimation_factor = None
+        self.trigger_delay_in_samples = None
+        self._stopping = Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def __iter__(self):
+        for payload, decode, timestamp, start_time in self.readouts():
+            yield self.build(decode(payload), timestamp, start_time)
+
+    def build(self, voltages, timestamp, start_time=0.0):
+        return self._oscilloscope._build_acquisition(self.channel, voltages, self.decimation_factor,
+                                                     self.trigger_delay_in_samples, timestamp, start_time)
+
+    def readouts(self):
+        oscilloscope = self._oscilloscope
+        self.decimation_factor = decimation_factor = oscilloscope.get_decimation_factor()
+        self.trigger_delay_in_samples = oscilloscope.get_trigger_delay_in_samples()
+        fill_time = oscilloscope._buffer_duration(decimation_factor)
+        statistics = self.statistics
+        statistics.started = time()
+
+        oscilloscope.command('ACQ:START')
+        armed_at = time()
+        while self.count is None or statistics.acquired < self.count:
+            remaining = armed_at + fill_time - time()
+            if self._stopping.wait(remaining) if remaining > 0 else self._stopping.is_set():
+                return
+            self._arm_trigger(statistics.last_timestamp)
+            detected_at = oscilloscope.wait_for_trigger(self.timeout, decimation_factor, self._stopping)
+            if detected_at is None:
+                return
+            if self.window is None:
+                query, start_time = 'DATA?', 0.0
+            else:
+                query, start_time = oscilloscope._window_query(self.window, decimation_factor,
+                                                               oscilloscope.get_trigger_position())
+            payload, decode = oscilloscope._query_raw_voltages(self.channel, query, self.out)
+            timestamp = time()
+            oscilloscope.trigger_wait.record_readout(detected_at, timestamp)
+            oscilloscope.command('ACQ:START')
+            armed_at = time()
+
+            self._count_dropped(timestamp)
+            statistics.acquired += 1
+            statistics.last_timestamp = timestamp
+            yield payload, decode, timestamp, start_time
+
+    def _arm_trigger(self, last_timestamp):
+        if self.trigger_source is None:
+            self._oscilloscope.trigger_immediately()
+            return
+        if self.period is not None and last_timestamp is not None and time() - last_timestamp > self.period:
+            self.statistics.late += 1
+        self._oscilloscope.set_trigger_event(self.trigger_source, self.edge)
+
+    def _count_dropped(self, timestamp):
+        last_timestamp = self.statistics.last_timestamp
+        if self.period is None or last_timestamp is None:
+            return
+        self.statistics.dropped += max(0, int(round((timestamp - last_timestamp) / self.period)) - 1)
@@ -0,0 +1,344 @@
+from __future__ import division
+from errno import ECONNRESET, EPIPE
+from socket import error as socket_error
+from SocketServer import BaseRequestHandler, ThreadingTCPServer
+from threading import RLock, Thread
+from time import sleep, time
+import numpy as np
+from scpipy.scpi import BINARY_SAMPLE_TYPE, ReceiveBuffer, encode_waveform_data
+
+
+class SimulatedRedPitaya(object):
+    base_sampling_rate = int(125e6)
+    buffer_size = 16384
+    identity = 'REDPITAYA,INSTR2014,0,01-02'
+    analog_inputs = ('AIN0', 'AIN1', 'AIN2', 'AIN3')
+
+    def __init__(self, noise=0.005, trigger_delay=0.0005, seed=None):
+        self.noise = noise
+        self.trigger_delay = trigger_delay
+        self.errors = []
+        self._random = np.random.RandomState(seed)
+        self._lock = RLock()
+        self._commands = self._build_command_table()
+        self.digital_states = {}
+        self.digital_directions = {}
+        self.analog_values = dict((pin, 0.0) for pin in self.analog_inputs)
+        self.reset_generator()
+        self.reset_acquisition()
+
+    def reset_generator(self):
+        self.generator = dict((channel, {'waveform': 'SINE', 'frequency': 1000.0, 'amplitude': 1.0,
+                                         'output': False, 'burst': False, 'burst_count': 1,
+                                         'burst_repetitions': 1, 'burst_period': 1000, 'data': None})
+                              for channel in (1, 2))
+
+    def reset_acquisition(self):
+        self.decimation_factor = 1
+        self.averaging = True
+        self.trigger_level = '0'
+        self.trigger_delay_in_samples = 0
+        self.data_format = 'ASCII'
+        self.trigger_source = None
+        self._started_at = None
+        self._triggered_at = None
+
+    def handle(self, message):
+        header, _, arguments = message.partition(' ')
+        with self._lock:
+            for pattern, channel_position, function in self._commands:
+                channel = self._match(header.upper(), pattern, channel_position)
+                if channel is not None:
+                    return function(channel, arguments) if channel_position is not None else function(arguments)
+        self.errors.append(message)
+        return 'ERR!' if header.endswith('?') else None
+
+    @staticmethod
+    def _match(header, pattern, channel_position):
+        if channel_position is None:
+            return 0 if header == pattern else None
+        prefix, suffix = pattern[:channel_position], pattern[channel_position:]
+        if not header.startswith(prefix) or not header.endswith(suffix):
+            return None
+        channel = header[len(prefix):len(header) - len(suffix)]
+        return int(channel) if channel in ('1', '2') else None
+
+    def _build_command_table(self):
+        commands = [
+            ('*IDN?', None, lambda arguments: self.identity),
+            ('*OPC?', None, lambda arguments: '1'),
+            ('DIG:PIN', None, self._set_digital_state),
+            ('DIG:PIN:DIR', None, self._set_digital_direction),
+            ('DIG:PIN?', None, self._get_digital_state),
+            ('ANALOG:PIN', None, self._set_analog_value),
+            ('ANALOG:PIN?', None, self._get_analog_value),
+            ('GEN:RST', None, lambda arguments: self.reset_generator()),
+            ('ACQ:START', None, self._start),
+            ('ACQ:STOP', None, self._stop),
+            ('ACQ:RST', None, lambda arguments: self.reset_acquisition()),
+            ('ACQ:DEC', None, self._set_decimation_factor),
+            ('ACQ:DEC?', None, lambda arguments: str(self.decimation_factor)),
+            ('ACQ:AVG', None, self._set_averaging),
+            ('ACQ:TRIG', None, self._set_trigger),
+            ('ACQ:TRIG:LEV', None, self._set_trigger_level),
+            ('ACQ:TRIG:LEV?', None, lambda arguments: self.trigger_level),
+            ('ACQ:TRIG:DLY', None, self._set_trigger_delay_in_samples),
+            ('ACQ:TRIG:DLY?', None, lambda arguments: str(self.trigger_delay_in_samples)),
+            ('ACQ:TRIG:DLY:NS', None, self._set_trigger_delay_in_ns),
+            ('ACQ:TRIG:DLY:NS?', None, lambda arguments: str(int(round(self._trigger_delay_in_ns())))),
+            ('ACQ:TRIG:STAT?', None, self._get_trigger_state),
+            ('ACQ:DATA:FORMAT', None, self._set_data_format),
+            ('ACQ:TPOS?', None, lambda arguments: str(self.trigger_position())),
+            ('ACQ:WPOS?', None, lambda arguments: str(self.write_position())),
+        ]
+        channel_commands = [
+            ('SOUR{}:FUNC', self._generator_setter('waveform', str.upper)),
+            ('SOUR{}:FREQ:FIX', self._generator_setter('frequency', float)),
+            ('SOUR{}:VOLT', self._generator_setter('amplitude', float)),
+            ('OUTPUT{}:STATE', self._generator_setter('output', lambda value: value.upper() == 'ON')),
+            ('SOUR{}:BURS:STAT', self._generator_setter('burst', lambda value: value.upper() == 'ON')),
+            ('SOUR{}:BURS:NCYC', self._generator_setter('burst_count', int)),
+            ('SOUR{}:BURS:NOR', self._generator_setter('burst_repetitions', int)),
+            ('SOUR{}:BURS:INT:PER', self._generator_setter('burst_period', int)),
+            ('SOUR{}:TRIG:IMM', lambda channel, arguments: None),
+            ('SOUR{}:TRAC:DATA:DATA', self._set_arbitrary_waveform_data),
+            ('ACQ:SOUR{}:DATA?', self._get_data),
+            ('ACQ:SOUR{}:DATA:STA:END?', self._get_data_between),
+            ('ACQ:SOUR{}:DATA:STA:N?', self._get_data_from),
+            ('ACQ:SOUR{}:DATA:OLD:N?', self._get_oldest_data),
+            ('ACQ:SOUR{}:DATA:LAT:N?', self._get_latest_data),
+        ]
+        commands.extend((pattern.replace('{}', ''), pattern.index('{}'), function)
+                        for pattern, function in channel_commands)
+        return commands
+
+    def _generator_setter(self, setting, convert):
+        def set_value(channel, arguments):
+            self.generator[channel][setting] = convert(arguments.strip())
+        return set_value
+
+    def _set_digital_state(self, arguments):
+        pin, state = arguments.split(',')
+        self.digital_states[pin.strip()] = state.strip()
+
+    def _set_digital_direction(self, arguments):
+        direction, pin = arguments.split(',')
+        self.digital_directions[pin.strip()] = direction.strip()
+
+    def _get_digital_state(self, arguments):
+        return self.digital_states.get(arguments.strip(), '0')
+
+    def _set_analog_value(self, arguments):
+        pin, value = arguments.split(',')
+        self.analog_values[pin.strip()] = float(value)
+
+    def _get_analog_value(self, arguments):
+        pin = arguments.strip()
+        value = self.analog_values.get(pin, 0.0)
+        if pin in self.analog_inputs:
+            value += self.noise * self._random.randn()
+        return repr(value)
+
+    def _set_arbitrary_waveform_data(self, channel, arguments):
+        self.generator[channel]['data'] = np.fromstring(arguments, sep=',')
+
+    def _start(self, arguments):
+        self._started_at = time()
+        self._triggered_at = None
+        self.trigger_source = None
+
+    def _stop(self, arguments):
+        self._started_at = None
+
+    def _set_decimation_factor(self, arguments):
+        self.decimation_factor = int(arguments)
+
+    def _set_averaging(self, arguments):
+        self.averaging = arguments.strip().upper() == 'ON'
+
+    def _set_trigger(self, arguments):
+        source = arguments.strip().upper()
+        if source == 'DISABLED':
+            self.trigger_source = None
+            self._triggered_at = None
+            return
+        if self._started_at is None:
+            return
+        self.trigger_source = source
+        self._triggered_at = time() if source == 'NOW' else time() + self.trigger_delay
+
+    def _set_trigger_level(self, arguments):
+        self.trigger_level = arguments.strip()
+
+    def _set_trigger_delay_in_samples(self, arguments):
+        self.trigger_delay_in_samples = int(arguments)
+
+    def _set_trigger_delay_in_ns(self, arguments):
+        sampling_interval_in_ns = 1e9 * self.decimation_factor / self.base_sampling_rate
+        self.trigger_delay_in_samples = int(round(float(arguments) / sampling_interval_in_ns))
+
+    def _trigger_delay_in_ns(self):
+        return 1e9 * self.trigger_delay_in_samples * self.decimation_factor / self.base_sampling_rate
+
+    def _post_trigger_time(self):
+        post_trigger_samples = max(0, self.buffer_size // 2 + self.trigger_delay_in_samples)
+        return post_trigger_samples * self.decimation_factor / self.base_sampling_rate
+
+    def _get_trigger_state(self, arguments):
+        if self._triggered_at is not None and time() >= self._triggered_at + self._post_trigger_time():
+            return 'TD'
+        return 'WAIT' if self._started_at is not None and self._triggered_at is not None else 'TD'
+
+    def _set_data_format(self, arguments):
+        self.data_format = 'BIN' if arguments.strip().upper().startswith('BIN') else 'ASCII'
+
+    def samples(self, channel):
+        settings = self.generator[channel]
+        times = np.arange(self.buffer_size) * (self.decimation_factor / self.base_sampling_rate)
+        if settings['output']:
+            voltages = settings['amplitude'] * self._waveform(settings, times)
+        else:
+            voltages = np.zeros(self.buffer_size)
+        return voltages + self.noise * self._random.randn(self.buffer_size)
+
+    @staticmethod
+    def _waveform(settings, times):
+        phase = (settings['frequency'] * times) % 1.0
+        waveform = settings['waveform']
+        if waveform == 'SQUARE':
+            return np.where(phase < 0.5, 1.0, -1.0)
+        if waveform == 'TRIANGLE':
+            return 1.0 - 4.0 * np.abs(phase - 0.5)
+        if waveform == 'SAWU':
+            return 2.0 * phase - 1.0
+        if waveform == 'SAWD':
+            return 1.0 - 2.0 * phase
+        if waveform == 'ARBITRARY' and settings['data'] is not None:
+            data = settings['data']
+            return data[(phase * len(data)).astype(int) % len(data)]
+        return np.sin(2 * np.pi * phase)
+
+    def write_position(self):
+        return 0
+
+    def trigger_position(self):
+        return (self.buffer_size // 2 - self.trigger_delay_in_samples) % self.buffer_size
+
+    def _get_data(self, channel, arguments):
+        return self._format_data(self.samples(channel))
+
+    def _get_data_between(self, channel, arguments):
+        start, end = [int(argument) for argument in arguments.split(',')]
+        return self._get_buffer_range(channel, start, (end - start) % self.buffer_size + 1)
+
+    def _get_data_from(self, channel, arguments):
+        start, number_of_samples = [int(argument) for argument in arguments.split(',')]
+        return self._get_buffer_range(channel, start, number_of_samples)
+
+    def _get_oldest_data(self, channel, arguments):
+        return self._get_buffer_range(channel, self.write_position(), int(arguments))
+
+    def _get_latest_data(self, channel, arguments):
+        number_of_samples = int(arguments)
+        return self._get_buffer_range(channel, self.write_position() - number_of_samples, number_of_samples)
+
+    def _get_buffer_range(self, channel, start, number_of_samples):
+        positions = (start + np.arange(min(number_of_samples, self.buffer_size))) % self.buffer_size
+        return self._format_data(self.samples(channel)[positions])
+
+    def _format_data(self, samples):
+        if self.data_format == 'BIN':
+            payload = samples.astype(BINARY_SAMPLE_TYPE).tobytes()
+            length = str(len(payload))
+            return '#{}{}{}'.format(len(length), length, payload)
+        return '{' + encode_waveform_data(samples) + '}'
+
+
+class SimulatorServer(object):
+    delimiter = ReceiveBuffer.delimiter
+    _disconnect_errors = (ECONNRESET, EPIPE)
+
+    def __init__(self, instrument=None, host='127.0.0.1', port=0, latency=0.0, bandwidth=None):
+        self.instrument = instrument or SimulatedRedPitaya()
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self._server = _SimulatorTcpServer((host, port), _SimulatorRequestHandler)
+        self._server.simulator = self
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.01})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def serve(self, connection):
+        try:
+            self._serve(connection)
+        except socket_error as error:
+            if error.errno not in self._disconnect_errors:
+                raise
+
+    def _serve(self, connection):
+        received = bytearray()
+        scanned = 0
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                return
+            received += chunk
+            while True:
+                index = received.find(self.delimiter, scanned)
+                if index < 0:
+                    scanned = max(0, len(received) - len(self.delimiter) + 1)
+                    break
+                message = bytes(received[:index])
+                del received[:index + len(self.delimiter)]
+                scanned = 0
+                reply = self.instrument.handle(message)
+                if reply is not None:
+                    self._send(connection, reply + self.delimiter)
+
+    def _send(self, connection, data):
+        if self.latency:
+            sleep(self.latency)
+        if not self.bandwidth:
+            connection.sendall(data)
+            return
+        chunk_size = 16384
+        view = memoryview(data)
+        for start in range(0, len(data), chunk_size):
+            chunk = view[start:start + chunk_size]
+            connection.sendall(chunk)
+            sleep(len(chunk) / self.bandwidth)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class _SimulatorTcpServer(ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _SimulatorRequestHandler(BaseRequestHandler):
+    def handle(self):
+        self.server.simulator.serve(self.request)
@@ -0,0 +1,167 @@
+from __future__ import division
+import json
+import os
+from struct import Struct
+import numpy as np
+from scpipy.scpi import Acquisition
+
+CAPTURE_MAGIC = 'SCPICAP1'
+HEADER_SIZE = 4096
+_COUNT = Struct('<Q')
+_HEADER_LENGTH = Struct('<I')
+_COUNT_OFFSET = len(CAPTURE_MAGIC)
+_HEADER_OFFSET = _COUNT_OFFSET + _COUNT.size + _HEADER_LENGTH.size
+
+
+def _record_type(header):
+    return np.dtype([('timestamp', '<f8'),
+                     ('voltages', header['dtype'], (len(header['channels']), header['number_of_samples']))])
+
+
+class CaptureWriter(object):
+    def __init__(self, path, chunk_size=64, dtype='<f4', metadata=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.dtype = np.dtype(dtype)
+        self.metadata = metadata or {}
+        self.header = None
+        self._record_type = None
+        self._file = None
+        self._records = None
+        self._count = None
+        self._capacity = 0
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, acquisition):
+        if self._file is None:
+            self._create(acquisition)
+        self._check(acquisition)
+        if self._length == self._capacity:
+            self._grow()
+        record = self._records[self._length]
+        record['timestamp'] = acquisition.timestamp if acquisition.timestamp is not None else np.nan
+        record['voltages'] = acquisition.voltages.reshape(record['voltages'].shape)
+        self._length += 1
+        self._count[0] = self._length
+
+    def extend(self, acquisitions):
+        for acquisition in acquisitions:
+            self.append(acquisition)
+
+    def flush(self):
+        if self._records is not None:
+            self._records.flush()
+            self._count.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._records = self._count = None
+        self._file.truncate(HEADER_SIZE + self._length * self._record_type.itemsize)
+        self._file.close()
+        self._file = None
+
+    def _create(self, acquisition):
+        self.header = {'number_of_samples': acquisition.number_of_samples,
+                       'channels': list(acquisition.channels),
+                       'dtype': self.dtype.str,
+                       'sampling_interval': acquisition.sampling_interval,
+                       'start_time': acquisition.start_time,
+                       'decimation_factor': acquisition.decimation_factor,
+                       'trigger_delay_in_samples': acquisition.trigger_delay_in_samples,
+                       'metadata': self.metadata}
+        encoded = json.dumps(self.header, sort_keys=True)
+        if _HEADER_OFFSET + len(encoded) > HEADER_SIZE:
+            raise ValueError('Capture metadata does not fit in the {} byte header'.format(HEADER_SIZE))
+        self._record_type = _record_type(self.header)
+        self._file = open(self.path, 'w+b')
+        self._file.write(CAPTURE_MAGIC + _COUNT.pack(0) + _HEADER_LENGTH.pack(len(encoded)) + encoded)
+        self._file.truncate(HEADER_SIZE)
+        self._file.flush()
+        self._count = np.memmap(self._file, dtype='<u8', mode='r+', offset=_COUNT_OFFSET, shape=(1,))
+
+    def _check(self, acquisition):
+        header = self.header
+        if (acquisition.number_of_samples != header['number_of_samples']
+                or list(acquisition.channels) != header['channels']
+                or acquisition.decimation_factor != header['decimation_factor']):
+            raise ValueError('Acquisition does not match the capture layout: {} samples of channels {} '
+                             'at decimation {}'.format(header['number_of_samples'], header['channels'],
+                                                       header['decimation_factor']))
+
+    def _grow(self):
+        if self._records is not None:
+            self._records.flush()
+        self._capacity += self.chunk_size
+        self._file.truncate(HEADER_SIZE + self._capacity * self._record_type.itemsize)
+        self._records = np.memmap(self._file, dtype=self._record_type, mode='r+', offset=HEADER_SIZE,
+                                  shape=(self._capacity,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class CaptureReader(object):
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as capture_file:
+            prefix = capture_file.read(_HEADER_OFFSET)
+            if len(prefix) < _HEADER_OFFSET or not prefix.startswith(CAPTURE_MAGIC):
+                raise ValueError('{} is not a capture file'.format(path))
+            length, = _HEADER_LENGTH.unpack_from(prefix, _COUNT_OFFSET + _COUNT.size)
+            self.header = json.loads(capture_file.read(length))
+        self._record_type = _record_type(self.header)
+        self.records = None
+        self.refresh()
+
+    def refresh(self):
+        with open(self.path, 'rb') as capture_file:
+            capture_file.seek(_COUNT_OFFSET)
+            count, = _COUNT.unpack(capture_file.read(_COUNT.size))
+        available = (os.path.getsize(self.path) - HEADER_SIZE) // self._record_type.itemsize
+        count = min(count, available)
+        if count:
+            self.records = np.memmap(self.path, dtype=self._record_type, mode='r', offset=HEADER_SIZE,
+                                     shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=self._record_type)
+        return count
+
+    @property
+    def metadata(self):
+        return self.header['metadata']
+
+    @property
+    def timestamps(self):
+        return self.records['timestamp']
+
+    @property
+    def voltages(self):
+        return self.records['voltages']
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        record = self.records[index]
+        header = self.header
+        channels = tuple(header['channels'])
+        voltages = record['voltages'] if len(channels) > 1 else record['voltages'][0]
+        return Acquisition(voltages, header['sampling_interval'], header['start_time'],
+                           channels if len(channels) > 1 else channels[0], header['decimation_factor'],
+                           header['trigger_delay_in_samples'], float(record['timestamp']))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def open_capture(path):
+    return CaptureReader(path)
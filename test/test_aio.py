@@ -0,0 +1,269 @@
+from unittest import TestCase
+from socket import error as socket_error, socket
+from threading import Thread
+import struct
+from scpipy.aio import *
+from scpipy.scpi import DataFormat, State, TriggerState, TriggerTimeoutError, TriggerWindow
+
+
+class FutureTest(TestCase):
+    def test_then_converts_result(self):
+        future = Future()
+        converted = future.then(int)
+        future.set_result('64')
+        self.assertEqual(64, converted.result())
+
+    def test_then_propagates_exception(self):
+        future = Future()
+        converted = future.then(int)
+        future.set_result('not a number')
+        self.assertIsInstance(converted.exception(), ValueError)
+
+    def test_result_before_done(self):
+        with self.assertRaises(RuntimeError):
+            Future().result()
+
+    def test_gather_keeps_order(self):
+        first, second = Future(), Future()
+        gathered = gather(first, second)
+        second.set_result(2)
+        self.assertFalse(gathered.done())
+        first.set_result(1)
+        self.assertEqual([1, 2], gathered.result())
+
+
+class EventLoopTest(TestCase):
+    def setUp(self):
+        self.loop = EventLoop()
+
+    def test_run_coroutine_with_return_value(self):
+        def add_later(a, b):
+            yield self.loop.sleep(0.001)
+            raise Return(a + b)
+        self.assertEqual(3, self.loop.run_until_complete(add_later(1, 2)))
+
+    def test_coroutine_exception_is_raised(self):
+        def fail():
+            yield self.loop.sleep(0)
+            raise KeyError('boom')
+        with self.assertRaises(KeyError):
+            self.loop.run_until_complete(fail())
+
+    def test_concurrent_sleeps_overlap(self):
+        order = []
+
+        def sleeper(name, delay):
+            yield self.loop.sleep(delay)
+            order.append(name)
+
+        self.loop.run_until_complete([sleeper('slow', 0.02), sleeper('fast', 0.01)])
+        self.assertEqual(['fast', 'slow'], order)
+
+    def test_coroutine_yielding_a_list_waits_for_all(self):
+        def both():
+            values = yield [self.loop.sleep(0.001, 'a'), self.loop.sleep(0, 'b')]
+            raise Return(values)
+        self.assertEqual(['a', 'b'], self.loop.run_until_complete(both()))
+
+
+class ScriptedServer(object):
+    def __init__(self, replies):
+        self._replies = replies
+        self._socket = socket()
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.listen(1)
+        self.port = self._socket.getsockname()[1]
+        self.received = []
+        self.drop = None
+        self.late = None
+        self._held = ''
+        self._thread = Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _serve(self):
+        try:
+            connection, _ = self._socket.accept()
+        except socket_error:
+            return
+        pending = ''
+        while True:
+            chunk = connection.recv(4096)
+            if not chunk:
+                break
+            pending += chunk
+            while '\r\n' in pending:
+                message, pending = pending.split('\r\n', 1)
+                self.received.append(message)
+                if message == self.drop:
+                    self.drop = None
+                    continue
+                replies = self._replies.get(message)
+                if replies:
+                    reply = replies.pop(0) + '\r\n'
+                    if message == self.late:
+                        self.late = None
+                        self._held = reply
+                        continue
+                    connection.sendall(self._held + reply)
+                    self._held = ''
+        connection.close()
+
+    def close(self):
+        self._socket.close()
+
+
+class AsyncControllersTest(TestCase):
+    def connect(self, replies):
+        self.server = ScriptedServer(replies)
+        self.loop = EventLoop()
+        self.connection = get_async_tcpip_scpi_connection('127.0.0.1', self.loop, port=self.server.port)
+        self.loop.run_until_complete(self.connection.open())
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.close()
+
+    def test_query(self):
+        self.connect({'ACQ:DEC?': ['64']})
+        self.assertEqual('64', self.loop.run_until_complete(self.connection.query('ACQ:DEC?')))
+
+    def test_queries_resolve_in_order(self):
+        self.connect({'ACQ:DEC?': ['64'], 'ACQ:TRIG:STAT?': ['TD']})
+        replies = self.loop.run_until_complete([self.connection.query('ACQ:DEC?'),
+                                                self.connection.query('ACQ:TRIG:STAT?')])
+        self.assertEqual(['64', 'TD'], replies)
+
+    def test_query_without_reply_exceeds_deadline(self):
+        self.connect({})
+        with self.assertRaises(DeadlineExceededError):
+            self.loop.run_until_complete(self.connection.query('ACQ:DEC?', timeout=0.01))
+
+    def test_connection_recovers_from_lost_reply(self):
+        self.connect({'*IDN?': [AsyncScpiConnection.resync_reply], 'ACQ:TRIG:STAT?': ['TD'], 'ACQ:DEC?': ['64']})
+        self.server.drop = 'ACQ:DEC?'
+        with self.assertRaises(DeadlineExceededError):
+            self.loop.run_until_complete(self.connection.query('ACQ:DEC?', timeout=0.01))
+
+        self.assertEqual('TD', self.loop.run_until_complete(self.connection.query('ACQ:TRIG:STAT?', timeout=1.0)))
+        self.assertEqual(['ACQ:DEC?', '*IDN?', 'ACQ:TRIG:STAT?'], self.server.received)
+
+    def test_late_reply_of_one_is_not_taken_for_the_marker(self):
+        self.connect({'*IDN?': [AsyncScpiConnection.resync_reply], 'ACQ:TRIG:STAT?': ['TD'], 'ACQ:DEC?': ['1']})
+        self.server.late = 'ACQ:DEC?'
+        with self.assertRaises(DeadlineExceededError):
+            self.loop.run_until_complete(self.connection.query('ACQ:DEC?', timeout=0.01))
+
+        self.assertEqual('TD', self.loop.run_until_complete(self.connection.query('ACQ:TRIG:STAT?', timeout=1.0)))
+        self.assertEqual(1, self.connection.stale_replies)
+
+    def test_digital_controller_get_state(self):
+        self.connect({'DIG:PIN? LED2': ['1']})
+        controller = AsyncDigitalController(self.connection)
+        self.assertEqual(State.HIGH, self.loop.run_until_complete(controller.get_state('LED2')))
+
+    def test_analog_controller_get_analog_input(self):
+        self.connect({'ANALOG:PIN? AIN3': ['1.8']})
+        controller = AsyncAnalogController(self.connection)
+        self.assertAlmostEqual(1.8, self.loop.run_until_complete(controller.get_analog_input('AIN3')))
+
+    def test_generator_commands_are_sent(self):
+        self.connect({'ACQ:DEC?': ['1']})
+        generator = AsyncGenerator(self.connection)
+        generator.reset()
+        generator.set_frequency(1, 1000)
+        self.loop.run_until_complete(self.connection.query('ACQ:DEC?'))
+        self.assertEqual(['GEN:RST', 'SOUR1:FREQ:FIX 1000', 'ACQ:DEC?'], self.server.received)
+
+    def test_oscilloscope_set_decimation_factor_waits_for_confirmation(self):
+        self.connect({'ACQ:DEC?': ['1', '64']})
+        oscilloscope = AsyncOscilloscope(self.connection)
+        self.loop.run_until_complete(oscilloscope.set_decimation_factor(64))
+        self.assertEqual(['ACQ:DEC 64', 'ACQ:DEC?', 'ACQ:DEC?'], self.server.received)
+
+    def test_oscilloscope_cached_decimation_factor(self):
+        self.connect({'ACQ:DEC?': ['64']})
+        oscilloscope = AsyncOscilloscope(self.connection, cache=True)
+        self.loop.run_until_complete(oscilloscope.set_decimation_factor(64))
+        self.assertEqual(64, self.loop.run_until_complete(oscilloscope.get_decimation_factor()))
+        self.assertEqual(['ACQ:DEC 64', 'ACQ:DEC?'], self.server.received)
+
+    def test_oscilloscope_get_acquisition(self):
+        self.connect({'ACQ:TRIG:STAT?': ['WAIT', 'TD'],
+                      'ACQ:SOUR1:DATA?': ['{0.5,1.5,-0.5}'],
+                      'ACQ:DEC?': ['8']})
+        oscilloscope = AsyncOscilloscope(self.connection)
+        acquisition = self.loop.run_until_complete(oscilloscope.get_acquisition(1))
+        self.assertEqual([0.5, 1.5, -0.5], acquisition.voltages.tolist())
+        self.assertEqual(8, acquisition.decimation_factor)
+        self.assertEqual(2, oscilloscope.trigger_wait.statistics.polls)
+
+    def test_oscilloscope_get_acquisition_in_trigger_window(self):
+        self.connect({'ACQ:TRIG:STAT?': ['TD'],
+                      'ACQ:TPOS?': ['100'],
+                      'ACQ:SOUR1:DATA:STA:END? 99,101': ['{0.5,1.5,-0.5}'],
+                      'ACQ:DEC?': ['1']})
+        oscilloscope = AsyncOscilloscope(self.connection)
+        acquisition = self.loop.run_until_complete(oscilloscope.get_acquisition(1, window=TriggerWindow(-8e-9, 8e-9)))
+        self.assertEqual([0.5, 1.5, -0.5], acquisition.voltages.tolist())
+        self.assertAlmostEqual(-8e-9, acquisition.start_time)
+
+    def test_oscilloscope_get_acquisitions(self):
+        self.connect({'ACQ:TRIG:STAT?': ['TD'],
+                      'ACQ:SOUR1:DATA?': ['{0.5,1.5}'],
+                      'ACQ:SOUR2:DATA?': ['{2.5,3.5}'],
+                      'ACQ:DEC?': ['1']})
+        oscilloscope = AsyncOscilloscope(self.connection)
+        acquisition = self.loop.run_until_complete(oscilloscope.get_acquisitions((1, 2)))
+        self.assertEqual([[0.5, 1.5], [2.5, 3.5]], acquisition.voltages.tolist())
+
+    def test_oscilloscope_get_acquisition_times_out(self):
+        self.connect({'ACQ:TRIG:STAT?': ['WAIT'] * 1000, 'ACQ:DEC?': ['1']})
+        oscilloscope = AsyncOscilloscope(self.connection)
+        with self.assertRaises(TriggerTimeoutError):
+            self.loop.run_until_complete(oscilloscope.get_acquisition(1, timeout=0.005))
+
+    def test_oscilloscope_stream(self):
+        self.connect({'ACQ:TRIG:STAT?': ['TD', 'TD'],
+                      'ACQ:SOUR1:DATA?': ['{0.5,1.5}', '{2.5,3.5}'],
+                      'ACQ:DEC?': ['1'],
+                      'ACQ:TRIG:DLY?': ['0']})
+        stream = AsyncOscilloscope(self.connection).stream(1, count=2)
+
+        def read_all():
+            acquisitions = []
+            while True:
+                acquisition = yield stream.read()
+                if acquisition is None:
+                    raise Return(acquisitions)
+                acquisitions.append(acquisition.voltages.tolist())
+
+        self.assertEqual([[0.5, 1.5], [2.5, 3.5]], self.loop.run_until_complete(read_all()))
+        self.assertEqual(2, stream.statistics.acquired)
+        self.assertEqual(['ACQ:DEC?', 'ACQ:TRIG:DLY?', 'ACQ:START'], self.server.received[:3])
+
+    def test_oscilloscope_stream_is_not_iterable(self):
+        self.connect({})
+        with self.assertRaises(TypeError):
+            iter(AsyncOscilloscope(self.connection).stream(1))
+
+    def test_oscilloscope_get_binary_data(self):
+        payload = struct.pack('>2f', 0.25, -0.75)
+        self.connect({'ACQ:SOUR2:DATA?': ['#1{}{}'.format(len(payload), payload)]})
+        oscilloscope = AsyncOscilloscope(self.connection)
+        oscilloscope._data_format = DataFormat.BINARY
+        data = self.loop.run_until_complete(oscilloscope.get_data(2))
+        self.assertEqual([0.25, -0.75], data.tolist())
+
+    def test_boards_are_driven_concurrently(self):
+        self.connect({'ACQ:TRIG:STAT?': ['TD']})
+        other_server = ScriptedServer({'ACQ:TRIG:STAT?': ['TD']})
+        other_connection = get_async_tcpip_scpi_connection('127.0.0.1', self.loop, port=other_server.port)
+        self.loop.run_until_complete(other_connection.open())
+        try:
+            states = self.loop.run_until_complete([AsyncOscilloscope(self.connection).get_trigger_state(),
+                                                   AsyncOscilloscope(other_connection).get_trigger_state()])
+            self.assertEqual([TriggerState.DISABLED, TriggerState.DISABLED], states)
+        finally:
+            other_connection.close()
+            other_server.close()
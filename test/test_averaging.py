@@ -0,0 +1,82 @@
+from unittest import TestCase
+import numpy as np
+from scpipy.averaging import AcquisitionAverager
+from scpipy.scpi import Acquisition
+
+
+def acquisitions(data):
+    return [Acquisition(voltages, sampling_interval=8e-9, start_time=-1e-6, channel=1, decimation_factor=1)
+            for voltages in data]
+
+
+class AcquisitionAveragerTest(TestCase):
+    def setUp(self):
+        self.data = np.random.RandomState(0).normal(0.2, 0.1, size=(50, 16))
+
+    def test_statistics_match_numpy(self):
+        averager = AcquisitionAverager().extend(acquisitions(self.data))
+        self.assertEqual(50, averager.count)
+        np.testing.assert_allclose(self.data.mean(axis=0), averager.mean)
+        np.testing.assert_allclose(self.data.var(axis=0, ddof=1), averager.variance)
+        np.testing.assert_allclose(self.data.min(axis=0), averager.minimum)
+        np.testing.assert_allclose(self.data.max(axis=0), averager.maximum)
+
+    def test_variance_needs_two_acquisitions(self):
+        averager = AcquisitionAverager().extend(acquisitions(self.data[:1]))
+        self.assertIsNone(averager.variance)
+
+    def test_result_keeps_the_timebase(self):
+        result = AcquisitionAverager().extend(acquisitions(self.data)).result()
+        self.assertEqual((-1e-6, 8e-9, 16), result.timebase)
+        self.assertEqual(1, result.channel)
+
+    def test_histogram(self):
+        averager = AcquisitionAverager(histogram_bins=4, histogram_range=(0.0, 1.0))
+        averager.extend(acquisitions([[0.1, 0.9], [0.2, 1.5], [0.6, -3.0]]))
+        self.assertEqual([[2, 0, 1, 0], [0, 0, 0, 1]], averager.histogram.tolist())
+        self.assertEqual([0, 1], averager.underflow.tolist())
+        self.assertEqual([0, 1], averager.overflow.tolist())
+        self.assertEqual([0.0, 0.25, 0.5, 0.75, 1.0], averager.histogram_edges.tolist())
+
+    def test_histogram_matches_numpy(self):
+        averager = AcquisitionAverager(histogram_bins=5, histogram_range=(-0.5, 0.5))
+        averager.extend(acquisitions(self.data))
+        edges = averager.histogram_edges
+        for index in range(self.data.shape[1]):
+            column = self.data[:, index]
+            self.assertEqual(np.histogram(column, edges)[0].tolist(), averager.histogram[index].tolist())
+            self.assertEqual(np.count_nonzero(column < edges[0]), averager.underflow[index])
+            self.assertEqual(np.count_nonzero(column > edges[-1]), averager.overflow[index])
+
+    def test_histogram_includes_the_upper_edge(self):
+        averager = AcquisitionAverager(histogram_bins=2, histogram_range=(0.0, 1.0))
+        averager.extend(acquisitions([[0.0, 1.0]]))
+        self.assertEqual([[1, 0], [0, 1]], averager.histogram.tolist())
+        self.assertEqual([0, 0], averager.overflow.tolist())
+
+    def test_merge_sums_out_of_range_counts(self):
+        first = AcquisitionAverager(histogram_bins=2, histogram_range=(0.0, 1.0)).extend(acquisitions([[2.0]]))
+        second = AcquisitionAverager(histogram_bins=2, histogram_range=(0.0, 1.0)).extend(acquisitions([[-1.0]]))
+        merged = AcquisitionAverager(histogram_bins=2, histogram_range=(0.0, 1.0)).merge(first).merge(second)
+        self.assertEqual([[0, 0]], merged.histogram.tolist())
+        self.assertEqual([1], merged.underflow.tolist())
+        self.assertEqual([1], merged.overflow.tolist())
+
+    def test_merge_matches_single_pass(self):
+        first = AcquisitionAverager().extend(acquisitions(self.data[:20]))
+        second = AcquisitionAverager().extend(acquisitions(self.data[20:]))
+        merged = AcquisitionAverager().merge(first).merge(second)
+        np.testing.assert_allclose(self.data.mean(axis=0), merged.mean)
+        np.testing.assert_allclose(self.data.var(axis=0, ddof=1), merged.variance)
+        self.assertEqual(50, merged.count)
+
+    def test_stacked_channels(self):
+        stacked = [Acquisition(voltages.reshape(2, 8), sampling_interval=8e-9, channel=(1, 2))
+                   for voltages in self.data]
+        averager = AcquisitionAverager().extend(stacked)
+        np.testing.assert_allclose(self.data.mean(axis=0).reshape(2, 8), averager.mean)
+
+    def test_mismatched_shape(self):
+        averager = AcquisitionAverager().extend(acquisitions(self.data))
+        with self.assertRaises(ValueError):
+            averager.add(acquisitions([np.zeros(8)])[0])
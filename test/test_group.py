@@ -0,0 +1,73 @@
+from unittest import TestCase
+from time import sleep, time
+from mock import Mock
+from scpipy.group import DeviceGroup
+from scpipy.scpi import ScpiConnection
+from test.test_scpi import mock_scpi_connection
+
+
+class DeviceGroupTest(TestCase):
+    hosts = ['rp-1.local', 'rp-2.local', 'rp-3.local', 'rp-4.local']
+
+    def setUp(self):
+        self.connections = {}
+        self.group = DeviceGroup(self.hosts, connect=self.connect)
+        self.group.open()
+
+    def connect(self, host, port):
+        connection = mock_scpi_connection()
+        self.connections[host] = connection
+        return connection
+
+    def test_open_opens_every_connection(self):
+        for host in self.hosts:
+            self.connections[host].open.assert_called_once_with()
+
+    def test_map_returns_results_in_host_order(self):
+        results = self.group.map(lambda device, suffix: device.host + suffix, '!')
+        self.assertEqual([host + '!' for host in self.hosts], [result.value for result in results])
+        self.assertEqual(self.hosts, [result.host for result in results])
+
+    def test_map_applies_calls_to_every_board(self):
+        self.group.map(lambda device: device.generator.set_frequency(1, 1000))
+        for host in self.hosts:
+            self.connections[host].write.assert_called_once_with('SOUR1:FREQ:FIX 1000')
+
+    def test_map_collects_errors_per_board(self):
+        def fail_on_second(device):
+            if device.host == 'rp-2.local':
+                raise IOError('unreachable')
+            return device.host
+
+        results = self.group.map(fail_on_second)
+
+        self.assertEqual([True, False, True, True], [result.ok for result in results])
+        self.assertIsInstance(results[1].error, IOError)
+
+    def test_map_runs_boards_concurrently(self):
+        start = time()
+        results = self.group.map(lambda device: sleep(0.1))
+        elapsed = time() - start
+        self.assertLess(elapsed, 0.3)
+        for result in results:
+            self.assertGreaterEqual(result.elapsed, 0.09)
+
+    def test_map_on_closed_group(self):
+        group = DeviceGroup(self.hosts, connect=lambda host, port: Mock(ScpiConnection))
+        with self.assertRaises(RuntimeError):
+            group.map(lambda device: None)
+
+    def test_close_unopened_group(self):
+        connection = Mock(ScpiConnection)
+        group = DeviceGroup(self.hosts, connect=lambda host, port: connection)
+        self.assertEqual([], group.close())
+        connection.close.assert_not_called()
+
+    def test_close_twice(self):
+        self.group.close()
+        self.assertEqual([], self.group.close())
+
+    def tearDown(self):
+        self.group.close()
+        for host in self.hosts:
+            self.connections[host].close.assert_called_once_with()
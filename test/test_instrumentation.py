@@ -0,0 +1,127 @@
+from unittest import TestCase
+from itertools import count
+from mock import Mock
+from scpipy.instrumentation import HistogramCollector, Instrumentation, InstrumentationHook, message_header
+from scpipy.links import TcpIpLink
+from scpipy.scpi import Oscilloscope, ScpiConnection
+
+
+def link_replying(*chunks):
+    link = Mock(TcpIpLink)
+    pending = list(chunks)
+
+    def read_into(buffer):
+        chunk = pending.pop(0)
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    link.read_into.side_effect = read_into
+    link.write.side_effect = len
+    return link
+
+
+class RecordingHook(InstrumentationHook):
+    def __init__(self):
+        self.started = []
+        self.finished = []
+
+    def before(self, record):
+        self.started.append(record.header)
+
+    def after(self, record):
+        self.finished.append(record)
+
+
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        self.hook = RecordingHook()
+        self.instrumentation = Instrumentation(self.hook)
+        ticks = count()
+        self.instrumentation.clock = lambda: next(ticks) * 0.001
+
+    def test_message_header(self):
+        self.assertEqual('SOUR1:FREQ:FIX', message_header('SOUR1:FREQ:FIX 1000'))
+        self.assertEqual('ACQ:DEC?', message_header('ACQ:DEC?'))
+
+    def test_command_is_recorded_when_written(self):
+        connection = ScpiConnection(link_replying(), instrumentation=self.instrumentation)
+        connection.write('SOUR1:FREQ:FIX 1000')
+
+        record, = self.hook.finished
+        self.assertEqual('SOUR1:FREQ:FIX', record.header)
+        self.assertEqual(len('SOUR1:FREQ:FIX 1000\r\n'), record.bytes_sent)
+        self.assertEqual(0, record.bytes_received)
+
+    def test_query_is_recorded_when_reply_is_read(self):
+        connection = ScpiConnection(link_replying('6', '4\r\n'), instrumentation=self.instrumentation)
+        oscilloscope = Oscilloscope(connection)
+
+        self.assertEqual(64, oscilloscope.get_decimation_factor())
+
+        self.assertEqual(['ACQ:DEC?'], self.hook.started)
+        record, = self.hook.finished
+        self.assertEqual(len('ACQ:DEC?\r\n'), record.bytes_sent)
+        self.assertEqual(len('64\r\n'), record.bytes_received)
+        self.assertEqual(2, record.chunks)
+        self.assertEqual(0.001, record.elapsed)
+
+    def test_pipelined_replies_are_matched_in_order(self):
+        connection = ScpiConnection(link_replying('64\r\n#12ab\r\n'), instrumentation=self.instrumentation)
+        with connection.batch():
+            decimation = connection.send_query('ACQ:DEC?')
+            data = connection.send_query('ACQ:SOUR1:DATA?', binary=True)
+        self.assertEqual('ab', data.value)
+        self.assertEqual('64', decimation.value)
+
+        self.assertEqual(['ACQ:DEC?', 'ACQ:SOUR1:DATA?'], [record.header for record in self.hook.finished])
+        self.assertEqual([4, 7], [record.bytes_received for record in self.hook.finished])
+        self.assertEqual([1, 0], [record.chunks for record in self.hook.finished])
+
+    def test_connection_counts_traffic_without_instrumentation(self):
+        connection = ScpiConnection(link_replying('64\r\n'))
+        connection.write('ACQ:DEC?')
+        connection.read()
+        self.assertEqual(10, connection.bytes_sent)
+        self.assertEqual(4, connection.bytes_received)
+        self.assertEqual(1, connection.chunks_received)
+
+
+class HistogramCollectorTest(TestCase):
+    def setUp(self):
+        self.collector = HistogramCollector(bin_edges=[0.001, 0.01, 0.1])
+        self.instrumentation = Instrumentation(self.collector)
+
+    def record(self, message, elapsed, bytes_received=0):
+        record = self.instrumentation.start(message, len(message) + 2)
+        record.started -= elapsed
+        self.instrumentation.finish(record, bytes_received)
+
+    def test_summary_per_header(self):
+        self.record('ACQ:DEC?', 0.002, 4)
+        self.record('ACQ:DEC?', 0.004, 4)
+        self.record('ACQ:START', 0.0005)
+
+        summary = self.collector.summary()
+        self.assertEqual(['ACQ:DEC?', 'ACQ:START'], self.collector.headers)
+        self.assertEqual(2, summary['ACQ:DEC?']['count'])
+        self.assertAlmostEqual(0.003, summary['ACQ:DEC?']['mean'], places=4)
+        self.assertEqual(8, summary['ACQ:DEC?']['bytes_received'])
+
+    def test_histogram_bins(self):
+        self.record('ACQ:DEC?', 0.0005)
+        self.record('ACQ:DEC?', 0.002)
+        self.record('ACQ:DEC?', 0.5)
+        self.assertEqual([1, 1, 0, 1], self.collector.histogram('ACQ:DEC?').tolist())
+
+    def test_percentile_is_bounded_by_bin_edges(self):
+        for _ in range(99):
+            self.record('ACQ:DEC?', 0.002)
+        self.record('ACQ:DEC?', 0.05)
+        self.assertEqual(0.01, self.collector.percentile('ACQ:DEC?', 50))
+        self.assertAlmostEqual(0.05, self.collector.percentile('ACQ:DEC?', 100), places=4)
+
+    def test_dominant_commands(self):
+        self.record('ACQ:SOUR1:DATA?', 0.05)
+        self.record('ACQ:TRIG:STAT?', 0.001)
+        self.record('ACQ:TRIG:STAT?', 0.001)
+        self.assertEqual('ACQ:SOUR1:DATA?', self.collector.dominant(1)[0][0])
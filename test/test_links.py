@@ -1,5 +1,10 @@
 from unittest import TestCase
-from scpipy.links import TcpIpLink, TcpIpAddress
+from StringIO import StringIO
+from socket import IPPROTO_TCP, SOL_SOCKET, SO_RCVBUF, SO_SNDBUF, TCP_NODELAY
+from time import time
+from scpipy.links import RecordingLink, ReplayLink, TcpIpLink, TcpIpAddress, TraceRecord, read_trace
+from scpipy.scpi import DeadlineExceededError, Oscilloscope, ScpiConnection
+from scpipy.simulator import SimulatedRedPitaya, SimulatorServer
 
 class TcpIpLinkTest(TestCase):
     host = 'rp-f0060c.local'
@@ -20,20 +25,147 @@ class TcpIpLinkTest(TestCase):
         response = self.link.read(4096)
         self.assertEqual('abcde', response)
 
+    def test_read_into_ethernet_link(self):
+        buffer = bytearray(8)
+        number_of_bytes = self.link.read_into(memoryview(buffer)[2:])
+        self.assertEqual(5, number_of_bytes)
+        self.assertEqual(bytearray('\x00\x00abcde\x00'), buffer)
+
     def test_write_ethernet_link(self):
         number_of_bytes = self.link.write(request='12345')
         self.assertEqual(5, number_of_bytes)
+
+    def test_write_sends_whole_request(self):
+        test_socket = TestSocket()
+        link = TcpIpLink(TcpIpAddress(self.host, self.port), alt_socket=test_socket)
+        request = memoryview(bytearray('1.0,' * 10000))
+
+        self.assertEqual(len(request), link.write(request))
+        self.assertEqual(len(request), len(test_socket.recv(65536)))
+
+    def test_default_socket_options(self):
+        test_socket = TestSocket()
+        TcpIpLink(TcpIpAddress(self.host, self.port), alt_socket=test_socket)
+        self.assertEqual({(IPPROTO_TCP, TCP_NODELAY): 1, (SOL_SOCKET, SO_RCVBUF): 262144}, test_socket.options)
+
+    def test_socket_options(self):
+        test_socket = TestSocket()
+        TcpIpLink(TcpIpAddress(self.host, self.port), alt_socket=test_socket, no_delay=False,
+                  receive_buffer_size=None, send_buffer_size=65536)
+        self.assertEqual({(SOL_SOCKET, SO_SNDBUF): 65536}, test_socket.options)
         
     def tearDown(self):
         self.link.close()
         
 
+class RecordingLinkTest(TestCase):
+    def setUp(self):
+        self.trace = StringIO()
+        self.link = RecordingLink(TcpIpLink(TcpIpAddress('rp-f0060c.local', 5000), alt_socket=TestSocket('64\r\n')),
+                                  self.trace)
+        self.link.clock = iter([0.0, 0.5, 0.75]).next
+        self.link.open()
+
+    def records(self):
+        self.trace.seek(0)
+        return list(read_trace(self.trace))
+
+    def test_writes_and_reads_are_recorded(self):
+        self.link.read_into(memoryview(bytearray(16)))
+        self.link.write('ACQ:DEC?\r\n')
+        self.link.close()
+        self.assertEqual([TraceRecord('R', 0.5, '64\r\n'), TraceRecord('W', 0.75, 'ACQ:DEC?\r\n')],
+                         self.records())
+
+    def test_timeout_is_forwarded_to_wrapped_link(self):
+        wrapped = TcpIpLink(TcpIpAddress('rp-f0060c.local', 5000), timeout=2.0, alt_socket=TestSocket())
+        link = RecordingLink(wrapped, StringIO())
+        link.set_timeout(0.25)
+        self.assertEqual(0.25, wrapped._socket.timeout)
+        self.assertEqual(2.0, link.timeout)
+
+    def test_invalid_trace(self):
+        with self.assertRaises(ValueError):
+            list(read_trace(StringIO('not a trace')))
+
+
+class ReplayLinkTest(TestCase):
+    def record_session(self):
+        trace = StringIO()
+        with SimulatorServer(SimulatedRedPitaya(seed=0)) as server:
+            link = RecordingLink(TcpIpLink(TcpIpAddress(server.host, server.port)), trace)
+            with ScpiConnection(link) as connection:
+                oscilloscope = Oscilloscope(connection)
+                oscilloscope.set_decimation_factor(8)
+                data = oscilloscope.get_data(1)
+        trace.seek(0)
+        return trace, data
+
+    def test_replayed_session_returns_recorded_replies(self):
+        trace, data = self.record_session()
+        with ScpiConnection(ReplayLink(trace, strict=True)) as connection:
+            oscilloscope = Oscilloscope(connection)
+            oscilloscope.set_decimation_factor(8)
+            self.assertEqual(data, oscilloscope.get_data(1))
+
+    def test_strict_replay_detects_divergence(self):
+        trace, _ = self.record_session()
+        with ScpiConnection(ReplayLink(trace, strict=True)) as connection:
+            with self.assertRaises(ValueError):
+                connection.write('ACQ:DEC 64')
+
+    def test_replay_with_original_timing(self):
+        trace = StringIO()
+        link = RecordingLink(TcpIpLink(TcpIpAddress('rp-f0060c.local', 5000), alt_socket=TestSocket('1\r\n')),
+                             trace)
+        link.open()
+        link.clock = lambda: link._started + 0.05
+        link.read(16)
+        trace.seek(0)
+
+        replay = ReplayLink(trace, speed=2.0)
+        replay.open()
+        start = time()
+        self.assertEqual('1\r\n', replay.read(16))
+        self.assertGreaterEqual(time() - start, 0.02)
+        self.assertEqual('', replay.read(16))
+
+    def test_replay_times_out_before_late_record(self):
+        trace = StringIO()
+        link = RecordingLink(TcpIpLink(TcpIpAddress('rp-f0060c.local', 5000), alt_socket=TestSocket('1\r\n')),
+                             trace)
+        link.open()
+        link.clock = lambda: link._started + 1.0
+        link.read(16)
+        trace.seek(0)
+
+        replay = ReplayLink(trace, speed=1.0)
+        replay.open()
+        connection = ScpiConnection(replay)
+        with self.assertRaises(DeadlineExceededError):
+            connection.read(timeout=0.01)
+        self.assertEqual('1\r\n', replay.read(16))
+
+    def test_replay_splits_large_reads(self):
+        trace = StringIO()
+        link = RecordingLink(TcpIpLink(TcpIpAddress('rp-f0060c.local', 5000), alt_socket=TestSocket('abcdef')),
+                             trace)
+        link.open()
+        link.read(16)
+        trace.seek(0)
+
+        replay = ReplayLink(trace)
+        self.assertEqual('abcd', replay.read(4))
+        self.assertEqual('ef', replay.read(4))
+
+
 class TestSocket(object):
     def __init__(self, buffer=''):
         self._buffer = buffer
+        self.options = {}
     
     def settimeout(self, timeout):
-        pass
+        self.timeout = timeout
 
     def connect(self, address):
         pass
@@ -44,7 +176,17 @@ class TestSocket(object):
     def recv(self, number_of_bytes):
         return self._buffer
 
+    def recv_into(self, buffer):
+        buffer[:len(self._buffer)] = self._buffer
+        return len(self._buffer)
+
+    def setsockopt(self, level, option, value):
+        self.options[(level, option)] = value
+
     def send(self, request):
         self._buffer = request
         return len(request)
+
+    def sendall(self, request):
+        self._buffer = str(bytearray(request))
     
@@ -0,0 +1,180 @@
+from unittest import TestCase
+from threading import Thread
+from mock import Mock
+from scpipy.multiplex import MultiplexedScpiConnection, ReplyFuture, is_query
+from scpipy.links import TcpIpAddress, TcpIpLink
+from scpipy.scpi import AnalogController, DataFormat, DeadlineExceededError, Generator, Oscilloscope, ReceiveBuffer
+from test.test_scpi import link_receiving
+from scpipy.simulator import SimulatedRedPitaya, SimulatorServer
+
+
+class ReplyFutureTest(TestCase):
+    def test_result(self):
+        reply = ReplyFuture()
+        reply.set_result('64')
+        self.assertTrue(reply.resolved)
+        self.assertEqual('64', reply.value)
+
+    def test_exception(self):
+        reply = ReplyFuture()
+        reply.set_exception(IOError('closed'))
+        with self.assertRaises(IOError):
+            reply.result()
+
+    def test_timeout(self):
+        with self.assertRaises(IOError):
+            ReplyFuture().result(0.001)
+
+    def test_is_query(self):
+        self.assertTrue(is_query('ACQ:SOUR1:DATA:STA:END? 0,10'))
+        self.assertFalse(is_query('ACQ:DEC 64'))
+
+
+class ParseReplyTest(TestCase):
+    def receive(self, *chunks):
+        received = ReceiveBuffer(64)
+        for chunk in chunks:
+            received.receive(link_receiving(chunk), len(chunk))
+        return received
+
+    def test_line(self):
+        self.assertEqual('64', self.receive('64\r\n').parse_reply())
+
+    def test_block_after_error_marker(self):
+        self.assertEqual('ab', self.receive('ERR!#12ab\r\n').parse_reply())
+
+    def test_partial_error_marker_waits_for_more(self):
+        received = self.receive('ER')
+        self.assertIsNone(received.parse_reply())
+        self.assertEqual(2, received.missing)
+
+
+class MultiplexedScpiConnectionTest(TestCase):
+    def setUp(self):
+        self.server = SimulatorServer(SimulatedRedPitaya(seed=0)).start()
+        self.connection = MultiplexedScpiConnection(TcpIpLink(TcpIpAddress(self.server.host, self.server.port)),
+                                                    timeout=5)
+        self.connection.open()
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.stop()
+
+    def test_query(self):
+        oscilloscope = Oscilloscope(self.connection)
+        oscilloscope.set_decimation_factor(64)
+        self.assertEqual(64, oscilloscope.get_decimation_factor())
+
+    def test_binary_replies_are_detected(self):
+        oscilloscope = Oscilloscope(self.connection)
+        oscilloscope.set_data_format(DataFormat.BINARY)
+        self.assertEqual(16384, len(oscilloscope.get_data(1)))
+        self.assertEqual(1, oscilloscope.get_decimation_factor())
+
+    def test_pipelined_channel_reads(self):
+        oscilloscope = Oscilloscope(self.connection)
+        oscilloscope.trigger_immediately()
+        acquisition = oscilloscope.get_acquisitions((1, 2), timeout=1)
+        self.assertEqual((2, 16384), acquisition.voltages.shape)
+
+    def test_read_without_query(self):
+        with self.assertRaises(IOError):
+            self.connection.read()
+
+    def test_threads_share_the_connection(self):
+        errors = []
+
+        def check(function, expected, repetitions=200):
+            try:
+                for _ in range(repetitions):
+                    value = function()
+                    if value != expected:
+                        errors.append((expected, value))
+            except Exception as error:
+                errors.append(error)
+
+        analog = AnalogController(self.connection)
+        analog.set_analog_output('AOUT0', 0.5)
+        analog.set_analog_output('AOUT1', 1.25)
+        generator = Generator(self.connection)
+        oscilloscope = Oscilloscope(self.connection)
+        oscilloscope.set_decimation_factor(8)
+        checks = [(lambda: analog.get_analog_input('AOUT0'), 0.5),
+                  (lambda: analog.get_analog_input('AOUT1'), 1.25),
+                  (oscilloscope.get_decimation_factor, 8),
+                  (lambda: len(oscilloscope.get_data(2)), 16384),
+                  (lambda: generator.set_frequency(1, 1000), None)]
+        threads = [Thread(target=check, args=(function, expected, 20 if expected == 16384 else 200))
+                   for function, expected in checks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+
+
+class MultiplexedScpiConnectionLifecycleTest(TestCase):
+    def test_close_unopened_connection(self):
+        link = Mock(TcpIpLink)
+        connection = MultiplexedScpiConnection(link)
+        connection.close()
+        link.close.assert_not_called()
+        with self.assertRaises(IOError):
+            connection.write('ACQ:START')
+
+    def test_close_twice(self):
+        with SimulatorServer() as server:
+            connection = MultiplexedScpiConnection(TcpIpLink(TcpIpAddress(server.host, server.port)))
+            connection.open()
+            connection.close()
+            connection.close()
+
+
+class DroppingRedPitaya(SimulatedRedPitaya):
+    def __init__(self, dropped, late=False):
+        SimulatedRedPitaya.__init__(self, seed=0)
+        self.dropped = dropped
+        self.late = late
+        self._held = None
+
+    def handle(self, message):
+        if message == self.dropped:
+            self.dropped = None
+            if self.late:
+                self._held = SimulatedRedPitaya.handle(self, message)
+            return None
+        reply = SimulatedRedPitaya.handle(self, message)
+        if self._held is not None and reply is not None:
+            reply, self._held = self._held + ReceiveBuffer.delimiter + reply, None
+        return reply
+
+
+class MultiplexedResynchronizationTest(TestCase):
+    def setUp(self):
+        self.server = SimulatorServer(DroppingRedPitaya('ACQ:DEC?')).start()
+        self.connection = MultiplexedScpiConnection(TcpIpLink(TcpIpAddress(self.server.host, self.server.port)),
+                                                    timeout=5)
+        self.connection.open()
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.stop()
+
+    def test_connection_recovers_from_lost_reply(self):
+        oscilloscope = Oscilloscope(self.connection)
+        with self.assertRaises(DeadlineExceededError):
+            oscilloscope.query('ACQ:DEC?', timeout=0.05)
+
+        self.assertEqual('1', oscilloscope.query('ACQ:DEC?'))
+        self.assertEqual('TD', oscilloscope.query('ACQ:TRIG:STAT?'))
+        self.assertEqual(0, self.connection.stale_replies)
+
+    def test_late_reply_of_one_is_not_taken_for_the_marker(self):
+        self.server.instrument.late = True
+        oscilloscope = Oscilloscope(self.connection)
+        with self.assertRaises(DeadlineExceededError):
+            oscilloscope.query('ACQ:DEC?', timeout=0.05)
+
+        self.assertEqual('TD', oscilloscope.query('ACQ:TRIG:STAT?'))
+        self.assertEqual(1, self.connection.stale_replies)
@@ -0,0 +1,112 @@
+from unittest import TestCase
+from multiprocessing.pool import ThreadPool
+from threading import Thread
+import numpy as np
+from time import sleep, time
+from scpipy.pipeline import AcquisitionPipeline
+from scpipy.scpi import BufferPool, Oscilloscope, TriggerTimeoutError, TriggerWait
+from scpipy.simulator import SimulatedRedPitaya, SimulatorServer
+from scpipy.scpi import get_tcpip_scpi_connection
+
+
+class ScriptedConnection(object):
+    def __init__(self, *responses):
+        self._responses = list(responses)
+        self.written_messages = []
+
+    def write(self, message):
+        self.written_messages.append(message)
+        return len(message)
+
+    def read(self, number_of_bytes=4096):
+        return self._responses.pop(0)
+
+    def read_block(self, number_of_bytes=4096):
+        return self._responses.pop(0)
+
+
+class AcquisitionPipelineTest(TestCase):
+    def test_acquisitions_are_delivered_in_order(self):
+        replies = ['1', '0'] + sum([['TD', '{{{0},{0}}}'.format(index)] for index in range(20)], [])
+        oscilloscope = Oscilloscope(ScriptedConnection(*replies))
+
+        with AcquisitionPipeline(oscilloscope.stream(1, count=20), workers=4, queue_size=2) as pipeline:
+            acquisitions = list(pipeline)
+
+        self.assertEqual([[index, index] for index in range(20)],
+                         [acquisition.voltages.tolist() for acquisition in acquisitions])
+        self.assertEqual(1, acquisitions[0].decimation_factor)
+        self.assertEqual(20, pipeline.statistics.acquired)
+
+    def test_reader_errors_reach_the_consumer(self):
+        oscilloscope = Oscilloscope(ScriptedConnection('1', '0', *['WAIT'] * 1000),
+                                    trigger_wait=TriggerWait(timeout=0.005))
+        with AcquisitionPipeline(oscilloscope.stream(1, count=1)) as pipeline:
+            with self.assertRaises(TriggerTimeoutError):
+                list(pipeline)
+
+    def test_stop_before_the_stream_ends(self):
+        replies = ['1', '0'] + ['TD', '{0.5}'] * 100
+        oscilloscope = Oscilloscope(ScriptedConnection(*replies))
+        pipeline = AcquisitionPipeline(oscilloscope.stream(1, count=100), queue_size=1).start()
+        next(iter(pipeline))
+        pipeline.stop()
+        self.assertLess(pipeline.statistics.acquired, 100)
+
+    def test_stop_while_waiting_for_a_trigger(self):
+        oscilloscope = Oscilloscope(ScriptedConnection('1', '0', *['WAIT'] * 100000))
+        pipeline = AcquisitionPipeline(oscilloscope.stream(1)).start()
+        sleep(0.02)
+        start = time()
+        pipeline.stop()
+        self.assertLess(time() - start, 1.0)
+        self.assertEqual(0, pipeline.statistics.acquired)
+
+    def test_buffer_pool_gives_each_decode_its_own_buffer(self):
+        replies = ['1', '0'] + sum([['TD', '{{{0},{0}}}'.format(index)] for index in range(10)], [])
+        oscilloscope = Oscilloscope(ScriptedConnection(*replies))
+        buffers = BufferPool(size=2)
+
+        with AcquisitionPipeline(oscilloscope.stream(1, count=10, out=buffers), workers=4) as pipeline:
+            acquisitions = list(pipeline)
+
+        self.assertEqual([[index, index] for index in range(10)],
+                         [acquisition.voltages.tolist() for acquisition in acquisitions])
+        self.assertEqual(10, buffers.allocated)
+
+    def test_a_single_out_buffer_is_rejected(self):
+        oscilloscope = Oscilloscope(ScriptedConnection())
+        with self.assertRaises(ValueError):
+            AcquisitionPipeline(oscilloscope.stream(1, out=np.empty(2, dtype=np.float32)))
+
+    def test_out_is_rejected_with_process_workers(self):
+        oscilloscope = Oscilloscope(ScriptedConnection())
+        with self.assertRaises(ValueError):
+            AcquisitionPipeline(oscilloscope.stream(1, out=BufferPool(size=2)), processes=True)
+
+    def test_stop_wakes_a_waiting_consumer(self):
+        oscilloscope = Oscilloscope(ScriptedConnection('1', '0', *['WAIT'] * 100000))
+        pipeline = AcquisitionPipeline(oscilloscope.stream(1)).start()
+        consumer = Thread(target=list, args=(pipeline,))
+        consumer.daemon = True
+        consumer.start()
+        sleep(0.02)
+        pipeline.stop()
+        consumer.join(1.0)
+        self.assertFalse(consumer.is_alive())
+
+    def test_shared_pool_is_left_running(self):
+        pool = ThreadPool(2)
+        oscilloscope = Oscilloscope(ScriptedConnection('1', '0', 'TD', '{0.5}'))
+        with AcquisitionPipeline(oscilloscope.stream(1, count=1), pool=pool) as pipeline:
+            list(pipeline)
+        self.assertEqual([1.5], pool.apply(lambda: [1.5]))
+        pool.terminate()
+
+    def test_process_workers_with_simulator(self):
+        with SimulatorServer(SimulatedRedPitaya(seed=0)) as server:
+            with get_tcpip_scpi_connection(server.host, server.port) as connection:
+                oscilloscope = Oscilloscope(connection)
+                with AcquisitionPipeline(oscilloscope.stream(1, count=3), processes=True) as pipeline:
+                    acquisitions = list(pipeline)
+        self.assertEqual([16384] * 3, [len(acquisition) for acquisition in acquisitions])
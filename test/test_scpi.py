@@ -1,5 +1,9 @@
-from unittest import TestCase, skip
-from mock import Mock
+from unittest import TestCase
+from mock import Mock, patch
+import numpy as np
+import socket
+import struct
+from threading import Event
 from scpipy import *
 from scpipy.links import TcpIpLink
 
@@ -29,17 +33,325 @@ class ScpiConnectionTest(TestCase):
         self.assertEqual(len(message), number_of_bytes)
 
     def test_read_text(self):
-        test_link = Mock(TcpIpLink)
-        test_link.read.return_value = 'ABCDEFG\r\n'
+        test_link = link_receiving('ABCDEFG\r\n')
         connection = ScpiConnection(test_link)
 
         message = connection.read()
         self.assertEqual('ABCDEFG', message)
 
+    def test_read_text_split_in_chunks(self):
+        test_link = link_receiving('ABC\r', 'DEF', 'G\r', '\n')
+        connection = ScpiConnection(test_link)
+
+        message = connection.read()
+        self.assertEqual('ABC\rDEFG', message)
+
+    def test_read_keeps_leftover_for_next_reply(self):
+        test_link = link_receiving('64\r\nTD\r', '\n')
+        connection = ScpiConnection(test_link)
+
+        self.assertEqual('64', connection.read())
+        self.assertEqual('TD', connection.read())
+
+    def test_read_block_consumes_a_reply_that_is_not_a_block(self):
+        connection = ScpiConnection(link_receiving('{0.5,1.5}\r\n64\r\n'))
+
+        with self.assertRaises(ValueError):
+            connection.read_block()
+        self.assertEqual('64', connection.read())
+
+    def test_read_removes_error_marker(self):
+        test_link = link_receiving('ERR!', '1.8\r\n')
+        connection = ScpiConnection(test_link)
+
+        self.assertEqual('1.8', connection.read())
+
+    def test_read_grows_buffer_for_large_replies(self):
+        reply = ','.join(['1.25'] * 1000)
+        test_link = link_receiving(*[reply[i:i + 100] for i in range(0, len(reply), 100)] + ['\r\n'])
+        connection = ScpiConnection(test_link, buffer_size=256)
+
+        self.assertEqual(reply, connection.read(number_of_bytes=64))
+
+    def test_read_from_closed_link(self):
+        test_link = link_receiving('')
+        connection = ScpiConnection(test_link)
+
+        with self.assertRaises(IOError):
+            connection.read()
+
+    def test_read_block(self):
+        test_link = link_receiving('#15ABCDE\r\n')
+        connection = ScpiConnection(test_link)
+
+        payload = connection.read_block()
+        self.assertEqual('ABCDE', payload)
+
+    def test_read_block_split_in_chunks(self):
+        test_link = link_receiving('#', '21', '0\r\n34', '567890', '\r\n')
+        connection = ScpiConnection(test_link)
+
+        payload = connection.read_block()
+        self.assertEqual('\r\n34567890', payload)
+
+    def test_read_block_followed_by_text(self):
+        test_link = link_receiving('ERR!#13abc\r\nTD\r\n')
+        connection = ScpiConnection(test_link)
+
+        self.assertEqual('abc', connection.read_block())
+        self.assertEqual('TD', connection.read())
+
+    def test_read_block_without_block_marker(self):
+        test_link = link_receiving('{1.2}\r\n')
+        connection = ScpiConnection(test_link)
+
+        with self.assertRaises(ValueError):
+            connection.read_block()
+
+
+class ScpiConnectionBatchTest(TestCase):
+    def setUp(self):
+        self.link = link_receiving('64\r\n#12ab\r\nTD\r\n')
+        self.link.write.side_effect = len
+        self.connection = ScpiConnection(self.link)
+
+    def test_batch_writes_commands_at_once(self):
+        with self.connection.batch():
+            self.connection.write('GEN:RST')
+            self.connection.write('SOUR1:FREQ:FIX 1000')
+            self.assertFalse(self.link.write.called)
+        self.link.write.assert_called_once_with('GEN:RST\r\nSOUR1:FREQ:FIX 1000\r\n')
+
+    def test_nested_batch_writes_on_outermost_exit(self):
+        with self.connection.batch():
+            self.connection.write('GEN:RST')
+            with self.connection.batch():
+                self.connection.write('ACQ:RST')
+            self.assertFalse(self.link.write.called)
+        self.link.write.assert_called_once_with('GEN:RST\r\nACQ:RST\r\n')
+
+    def test_read_inside_batch_flushes_pending_commands(self):
+        with self.connection.batch():
+            self.connection.write('ACQ:DEC 64')
+            self.connection.write('ACQ:DEC?')
+            self.assertEqual('64', self.connection.read())
+        self.link.write.assert_called_once_with('ACQ:DEC 64\r\nACQ:DEC?\r\n')
+
+    def test_pipelined_queries_are_read_in_order(self):
+        with self.connection.batch():
+            decimation = self.connection.send_query('ACQ:DEC?')
+            data = self.connection.send_query('ACQ:SOUR1:DATA?', binary=True)
+            state = self.connection.send_query('ACQ:TRIG:STAT?')
+        self.link.write.assert_called_once_with('ACQ:DEC?\r\nACQ:SOUR1:DATA?\r\nACQ:TRIG:STAT?\r\n')
+        self.assertEqual('TD', state.value)
+        self.assertTrue(decimation.resolved)
+        self.assertEqual('64', decimation.value)
+        self.assertEqual('ab', data.value)
+
+    def test_read_after_pipelined_query_gets_its_own_reply(self):
+        decimation = self.connection.send_query('ACQ:DEC?')
+        self.connection.send_query('ACQ:SOUR1:DATA?', binary=True)
+        self.connection.write('ACQ:TRIG:STAT?')
+        self.assertEqual('TD', self.connection.read())
+        self.assertEqual('64', decimation.value)
+
+
+def mock_scpi_connection():
+    connection = Mock(ScpiConnection)
+    connection.write_encoded.side_effect = lambda data: connection.write(data[:-len(ScpiConnection.delimiter)])
+    return connection
+
+
+def link_receiving(*chunks):
+    link = Mock(TcpIpLink)
+    pending = list(chunks)
+
+    def read_into(buffer):
+        chunk = pending.pop(0)
+        if len(chunk) > len(buffer):
+            pending.insert(0, chunk[len(buffer):])
+            chunk = chunk[:len(buffer)]
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    link.read_into.side_effect = read_into
+    return link
+
+
+TIMEOUT = object()
+IDENTITY = ScpiConnection.resync_reply + '\r\n'
+
+
+def link_timing_out(*chunks):
+    link = link_receiving(*[chunk for chunk in chunks if chunk is not TIMEOUT])
+    read_into = link.read_into.side_effect
+    timeouts = [chunk is TIMEOUT for chunk in chunks]
+
+    def read_into_or_time_out(buffer):
+        while timeouts and timeouts.pop(0):
+            raise socket.timeout()
+        return read_into(buffer)
+
+    link.read_into.side_effect = read_into_or_time_out
+    link.timeout = None
+    link.write.side_effect = len
+    return link
+
+
+class ScpiConnectionDeadlineTest(TestCase):
+    def written(self, link):
+        return [call[0][0] for call in link.write.call_args_list]
+
+    def test_read_raises_deadline_exceeded_when_link_times_out(self):
+        link = link_timing_out(TIMEOUT)
+        connection = ScpiConnection(link)
+        connection.write('ACQ:DEC?')
+        with self.assertRaises(DeadlineExceededError):
+            connection.read(timeout=0.5)
+        self.assertEqual(0.5, round(link.set_timeout.call_args_list[-2][0][0], 1))
+        link.set_timeout.assert_called_with(None)
+
+    def test_late_reply_is_drained_by_resynchronization(self):
+        link = link_timing_out(TIMEOUT, '64\r\n' + IDENTITY, 'TD\r\n')
+        connection = ScpiConnection(link)
+        connection.write('ACQ:DEC?')
+        with self.assertRaises(DeadlineExceededError):
+            connection.read(timeout=0.5)
+        connection.write('ACQ:TRIG:STAT?')
+
+        self.assertEqual('TD', connection.read())
+        self.assertEqual(1, connection.stale_replies)
+        self.assertEqual(['ACQ:DEC?\r\n', '*IDN?\r\n', 'ACQ:TRIG:STAT?\r\n'], self.written(link))
+
+    def test_late_reply_of_one_is_not_taken_for_the_marker(self):
+        link = link_timing_out(TIMEOUT, '1\r\n', IDENTITY, 'TD\r\n')
+        connection = ScpiConnection(link)
+        connection.write('ACQ:DEC?')
+        with self.assertRaises(DeadlineExceededError):
+            connection.read(timeout=0.5)
+        connection.write('ACQ:TRIG:STAT?')
+
+        self.assertEqual('TD', connection.read(timeout=0.5))
+        self.assertEqual(1, connection.stale_replies)
+
+    def test_connection_recovers_from_lost_reply(self):
+        link = link_timing_out(TIMEOUT, IDENTITY, 'TD\r\n', '8\r\n', '0\r\n')
+        connection = ScpiConnection(link)
+        connection.write('ACQ:DEC?')
+        with self.assertRaises(DeadlineExceededError):
+            connection.read(timeout=0.5)
+
+        replies = []
+        for message in ('ACQ:TRIG:STAT?', 'ACQ:DEC?', 'ACQ:TRIG:DLY?'):
+            connection.write(message)
+            replies.append(connection.read(timeout=0.5))
+
+        self.assertEqual(['TD', '8', '0'], replies)
+        self.assertEqual(0, connection.stale_replies)
+
+    def test_timed_out_resynchronization_is_retried(self):
+        link = link_timing_out(TIMEOUT, TIMEOUT, IDENTITY * 2 + 'TD\r\n')
+        connection = ScpiConnection(link)
+        connection.write('ACQ:DEC?')
+        with self.assertRaises(DeadlineExceededError):
+            connection.read(timeout=0.5)
+        with self.assertRaises(DeadlineExceededError):
+            connection.write('ACQ:TRIG:STAT?', timeout=0.5)
+
+        connection.write('ACQ:TRIG:STAT?')
+        self.assertEqual('TD', connection.read())
+
+    def test_timed_out_pending_replies_fail(self):
+        connection = ScpiConnection(link_timing_out(TIMEOUT))
+        decimation = connection.send_query('ACQ:DEC?')
+        state = connection.send_query('ACQ:TRIG:STAT?')
+        with self.assertRaises(DeadlineExceededError):
+            connection.resolve(timeout=0.5)
+        with self.assertRaises(DeadlineExceededError):
+            state.value
+        with self.assertRaises(DeadlineExceededError):
+            decimation.value
+
+    def test_expired_deadline_fails_before_writing(self):
+        link = link_timing_out()
+        connection = ScpiConnection(link)
+        with connection.deadline(-1):
+            with self.assertRaises(DeadlineExceededError):
+                connection.write('ACQ:DEC?')
+        link.write.assert_not_called()
+
+    def test_latency_budget_bounds_every_read(self):
+        connection = ScpiConnection(link_timing_out(TIMEOUT), latency_budget=0.5)
+        connection.write('ACQ:DEC?')
+        with self.assertRaises(DeadlineExceededError):
+            connection.read()
+
+    def test_query_shares_one_deadline_between_write_and_read(self):
+        link = link_timing_out('64\r\n')
+        controller = Oscilloscope(ScpiConnection(link))
+        clock = Mock(side_effect=[0.0, 0.1, 0.2])
+
+        with patch('scpipy.scpi.time', clock):
+            self.assertEqual('64', controller.query('ACQ:DEC?', timeout=0.5))
+
+        remaining = [call[0][0] for call in link.set_timeout.call_args_list]
+        self.assertEqual([0.4, None, 0.3, None], [None if value is None else round(value, 6)
+                                                  for value in remaining])
+
+
+class CommandTemplateTest(TestCase):
+    def test_plain_fields_match_str_format(self):
+        template = CommandTemplate('SOUR{}:FREQ:FIX {}')
+        for value in (1000, 0.5, 1.0 / 3, 1e-7, '12.5'):
+            self.assertEqual('SOUR1:FREQ:FIX {}'.format(value), template(1, value))
+
+    def test_enum_fields_use_their_value(self):
+        template = CommandTemplate('ACQ:TRIG {.value}_{.value}')
+        self.assertEqual('ACQ:TRIG CH1_PE', template(TriggerSource.CH1, Edge.POSITIVE))
+
+    def test_literal_percent_is_preserved(self):
+        self.assertEqual('A%B 1', CommandTemplate('A%B {}')(1))
+
+    def test_encode_appends_delimiter(self):
+        self.assertEqual('DIG:PIN LED2,1\r\n', CommandTemplate('DIG:PIN {},{.value}').encode('LED2', State.HIGH))
+
+    def test_template_without_fields(self):
+        self.assertEqual('ACQ:START', CommandTemplate('ACQ:START')())
+
+    def test_encoded_command_is_written_in_one_piece(self):
+        link = Mock(TcpIpLink)
+        link.write.side_effect = len
+        connection = ScpiConnection(link)
+
+        DigitalController(connection).set_state('LED2', State.HIGH)
+
+        link.write.assert_called_once_with('DIG:PIN LED2,1\r\n')
+        self.assertEqual(16, connection.bytes_sent)
+
+    def test_encoded_commands_join_a_batch(self):
+        link = Mock(TcpIpLink)
+        link.write.side_effect = len
+        connection = ScpiConnection(link)
+        controller = DigitalController(connection)
+
+        with connection.batch():
+            controller.set_state('LED2', State.HIGH)
+            controller.set_state('LED3', State.LOW)
+
+        link.write.assert_called_once_with('DIG:PIN LED2,1\r\nDIG:PIN LED3,0\r\n')
+
+    def test_unsupported_field_is_rejected(self):
+        with self.assertRaises(ValueError):
+            CommandTemplate('SOUR{channel}:VOLT {}')
+
+    def test_wrong_number_of_arguments(self):
+        with self.assertRaises(TypeError):
+            CommandTemplate('DIG:PIN {},{.value}')('LED2')
+
 
 class DigitalControllerTest(TestCase):
     def setUp(self):
-        self.connection = Mock(ScpiConnection)
+        self.connection = mock_scpi_connection()
         self.connection.open()
         self.controller = DigitalController(self.connection)
 
@@ -88,7 +400,7 @@ class DigitalControllerTest(TestCase):
 
 class AnalogControllerTest(TestCase):
     def setUp(self):
-        self.connection = Mock(ScpiConnection)
+        self.connection = mock_scpi_connection()
         self.connection.open()
         self.controller = AnalogController(self.connection)
 
@@ -119,7 +431,7 @@ class AnalogControllerTest(TestCase):
         
 class GeneratorTest(TestCase):
     def setUp(self):
-        self.connection = Mock(ScpiConnection)
+        self.connection = mock_scpi_connection()
         self.connection.open()
         self.generator = Generator(self.connection)
 
@@ -196,11 +508,190 @@ class GeneratorTest(TestCase):
         data = [1, 0.5, 0.2]
         self.generator.set_arbitrary_waveform_data(channel, data)
         self.assert_written_message_is('SOUR1:TRAC:DATA:DATA 1,0.5,0.2')
+
+    def test_set_arbitrary_waveform_data_from_array(self):
+        channel = 2
+        data = np.array([0.0, -0.25, 10.0, 0.123456, -1e-7])
+        self.generator.set_arbitrary_waveform_data(channel, data)
+        self.assert_written_message_is('SOUR2:TRAC:DATA:DATA 0,-0.25,10,0.12346,-0')
         
     def tearDown(self):
         self.connection.close()
 
 
+class EncodeWaveformDataTest(TestCase):
+    def test_matches_fixed_point_formatting(self):
+        data = np.random.RandomState(0).uniform(-1, 1, 1000)
+        data[::7] = np.round(data[::7], 2)
+        data[::11] = 0
+        expected = ','.join('{:1.5f}'.format(value).rstrip('0').rstrip('.') for value in data)
+        self.assertEqual(expected, encode_waveform_data(data))
+
+    def test_empty_waveform(self):
+        self.assertEqual('', encode_waveform_data([]))
+
+    def test_half_way_values_match_fixed_point_formatting(self):
+        data = np.array([0.611105, -0.727995, 5e-06, -5e-06, 0.000015, 2.5e-06, 100.0, -0.0, 10.5])
+        data = np.concatenate([data, np.round(np.random.RandomState(1).uniform(-1, 1, 10000), 6)])
+        expected = ','.join('{:1.5f}'.format(value).rstrip('0').rstrip('.') for value in data)
+        self.assertEqual(expected, encode_waveform_data(data))
+
+
+class GeneratorCacheTest(TestCase):
+    def setUp(self):
+        self.connection = mock_scpi_connection()
+        self.generator = Generator(self.connection, cache=True)
+
+    def test_repeated_setting_is_sent_once(self):
+        self.generator.set_frequency(1, 1000)
+        self.generator.set_frequency(1, 1000)
+        self.connection.write.assert_called_once_with('SOUR1:FREQ:FIX 1000')
+
+    def test_settings_are_cached_per_channel(self):
+        self.generator.set_amplitude(1, 0.5)
+        self.generator.set_amplitude(2, 0.5)
+        self.assertEqual(2, self.connection.write.call_count)
+
+    def test_changed_setting_is_sent(self):
+        self.generator.enable_burst(1)
+        self.generator.disable_burst(1)
+        self.generator.disable_burst(1)
+        self.assertEqual(2, self.connection.write.call_count)
+
+    def test_reset_invalidates_cache(self):
+        self.generator.set_waveform(1, Waveform.SQUARE)
+        self.generator.reset()
+        self.generator.set_waveform(1, Waveform.SQUARE)
+        self.assertEqual(['SOUR1:FUNC SQUARE', 'GEN:RST', 'SOUR1:FUNC SQUARE'],
+                         [call[0][0] for call in self.connection.write.call_args_list])
+
+    def test_refresh_invalidates_cache(self):
+        self.generator.set_burst_count(1, 3)
+        self.generator.refresh()
+        self.generator.set_burst_count(1, 3)
+        self.assertEqual(2, self.connection.write.call_count)
+
+    def test_identical_waveform_is_uploaded_once(self):
+        self.generator.set_arbitrary_waveform_data(1, [0.1, 0.2])
+        self.generator.set_arbitrary_waveform_data(1, np.array([0.1, 0.2]))
+        self.generator.set_arbitrary_waveform_data(2, [0.1, 0.2])
+        self.generator.set_arbitrary_waveform_data(1, [0.2, 0.1])
+        self.assertEqual(['SOUR1:TRAC:DATA:DATA 0.1,0.2', 'SOUR2:TRAC:DATA:DATA 0.1,0.2',
+                          'SOUR1:TRAC:DATA:DATA 0.2,0.1'],
+                         [call[0][0] for call in self.connection.write.call_args_list])
+
+    def test_cache_is_disabled_by_default(self):
+        generator = Generator(self.connection)
+        generator.set_frequency(1, 1000)
+        generator.set_frequency(1, 1000)
+        self.assertEqual(2, self.connection.write.call_count)
+
+
+class OscilloscopeCacheTest(TestCase):
+    def test_confirmed_decimation_factor_is_served_from_cache(self):
+        connection = SequenceScpiConnection('64')
+        oscilloscope = Oscilloscope(connection, cache=True)
+
+        oscilloscope.set_decimation_factor(64)
+        oscilloscope.set_decimation_factor(64)
+
+        self.assertEqual(64, oscilloscope.get_decimation_factor())
+        self.assertEqual(['ACQ:DEC 64', 'ACQ:DEC?'], connection.written_messages)
+
+    def test_getter_queries_only_once(self):
+        connection = SequenceScpiConnection('100')
+        oscilloscope = Oscilloscope(connection, cache=True)
+
+        self.assertEqual(100, oscilloscope.get_trigger_delay_in_samples())
+        self.assertEqual(100, oscilloscope.get_trigger_delay_in_samples())
+        self.assertEqual(['ACQ:TRIG:DLY?'], connection.written_messages)
+
+    def test_setting_delay_in_ns_invalidates_delay_in_samples(self):
+        connection = SequenceScpiConnection('100', '200')
+        oscilloscope = Oscilloscope(connection, cache=True)
+
+        oscilloscope.get_trigger_delay_in_samples()
+        oscilloscope.set_trigger_delay_in_ns(1600)
+
+        self.assertEqual(200, oscilloscope.get_trigger_delay_in_samples())
+
+    def test_reset_invalidates_cache(self):
+        connection = SequenceScpiConnection('8', '8')
+        oscilloscope = Oscilloscope(connection, cache=True)
+
+        oscilloscope.set_decimation_factor(8)
+        oscilloscope.reset()
+        oscilloscope.set_decimation_factor(8)
+
+        self.assertEqual(['ACQ:DEC 8', 'ACQ:DEC?', 'ACQ:RST', 'ACQ:DEC 8', 'ACQ:DEC?'],
+                         connection.written_messages)
+
+    def test_refresh_reads_settings_from_board(self):
+        connection = SequenceScpiConnection('64', '10', '0')
+        oscilloscope = Oscilloscope(connection, cache=True)
+
+        oscilloscope.refresh()
+
+        self.assertEqual(['ACQ:DEC?', 'ACQ:TRIG:LEV?', 'ACQ:TRIG:DLY?'], connection.written_messages)
+        self.assertEqual(64, oscilloscope.get_decimation_factor())
+        self.assertEqual(3, len(connection.written_messages))
+
+
+class BufferPoolTest(TestCase):
+    def test_released_buffer_is_reused(self):
+        pool = BufferPool(size=8)
+        buffer = pool.acquire()
+        pool.release(buffer[:3])
+        self.assertIs(buffer, pool.acquire())
+        self.assertEqual(1, pool.allocated)
+
+    def test_capacity_bounds_free_buffers(self):
+        pool = BufferPool(size=8, capacity=1)
+        buffers = [pool.acquire(), pool.acquire()]
+        for buffer in buffers:
+            pool.release(buffer)
+        self.assertEqual(1, len(pool))
+
+    def test_foreign_buffer_is_rejected(self):
+        with self.assertRaises(ValueError):
+            BufferPool(size=8).release(np.zeros(8))
+
+
+class AcquisitionTest(TestCase):
+    def setUp(self):
+        self.acquisition = Acquisition([1.0, 2.0, 3.0, 4.0], sampling_interval=0.5, start_time=-1.0)
+
+    def test_timebase(self):
+        self.assertEqual((-1.0, 0.5, 4), self.acquisition.timebase)
+
+    def test_times(self):
+        self.assertEqual([-1.0, -0.5, 0.0, 0.5], self.acquisition.times.tolist())
+
+    def test_length(self):
+        self.assertEqual(4, len(self.acquisition))
+
+    def test_voltages_are_an_array(self):
+        self.assertEqual((4,), self.acquisition.voltages.shape)
+
+    def test_stacked_channels_share_the_timebase(self):
+        acquisition = Acquisition([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]], sampling_interval=0.5, channel=(1, 2))
+        self.assertEqual(3, len(acquisition))
+        self.assertEqual((1, 2), acquisition.channels)
+        self.assertEqual([4.0, 5.0, 6.0], acquisition.for_channel(2).voltages.tolist())
+        self.assertEqual(acquisition.timebase, acquisition.for_channel(2).timebase)
+
+
+class TriggerWaitTest(TestCase):
+    def test_poll_interval_follows_buffer_duration(self):
+        trigger_wait = TriggerWait(min_interval=0.0001, max_interval=0.01)
+        self.assertAlmostEqual(0.001, trigger_wait.poll_interval(0.008))
+
+    def test_poll_interval_is_bounded(self):
+        trigger_wait = TriggerWait(min_interval=0.0001, max_interval=0.01)
+        self.assertEqual(0.0001, trigger_wait.poll_interval(16384 / 125e6))
+        self.assertEqual(0.01, trigger_wait.poll_interval(8.6))
+
+
 class OscilloscopeTest(TestCase):
 
     def setUp(self):
@@ -218,11 +709,21 @@ class OscilloscopeTest(TestCase):
     def test_reset(self):
         self.oscilloscope.reset()
 
+    def test_reset_restores_ascii_data_format(self):
+        self.oscilloscope.set_data_format(DataFormat.BINARY)
+        self.oscilloscope.reset()
+        self.assertEqual(DataFormat.ASCII, self.oscilloscope.get_data_format())
+
     def test_set_decimation_factor(self):
         factor = 65536
         self.connection.buffer = '65536'
         self.oscilloscope.set_decimation_factor(factor)
 
+    def test_set_decimation_factor_gives_up_when_not_confirmed(self):
+        self.connection.buffer = '1'
+        with self.assertRaises(DeadlineExceededError):
+            self.oscilloscope.set_decimation_factor(8, timeout=0.005)
+
     def test_get_decimation_factor(self):
         self.connection.buffer = '65536'
         factor = self.oscilloscope.get_decimation_factor()
@@ -275,10 +776,219 @@ class OscilloscopeTest(TestCase):
         self.assertAlmostEqual([1.2, 3.2, -1.2], self.oscilloscope.get_data(channel)) 
 
 
-    @skip('WIP: get_acquisition needs two distinct connection buffer outputs')
+    def test_set_data_format(self):
+        connection = MockScpiConnection('ACQ:DATA:FORMAT BIN')
+        oscilloscope = Oscilloscope(connection)
+        oscilloscope.set_data_format(DataFormat.BINARY)
+        self.assertTrue(connection.is_write_called)
+        self.assertEqual(DataFormat.BINARY, oscilloscope.get_data_format())
+
+    def test_get_binary_data(self):
+        self.oscilloscope.set_data_format(DataFormat.BINARY)
+        self.connection.buffer = struct.pack('>3f', 1.5, 3.25, -1.0)
+        channel = 1
+        self.assertEqual([1.5, 3.25, -1.0], self.oscilloscope.get_data(channel).tolist())
+
+    def test_get_binary_data_into_buffer(self):
+        self.oscilloscope.set_data_format(DataFormat.BINARY)
+        self.connection.buffer = struct.pack('>3f', 1.5, 3.25, -1.0)
+        out = np.zeros(4, dtype=np.float32)
+
+        data = self.oscilloscope.get_data(1, out=out)
+
+        self.assertEqual([1.5, 3.25, -1.0, 0.0], out.tolist())
+        self.assertIs(out, data.base)
+
+    def test_get_ascii_data_into_buffer(self):
+        self.connection.buffer = '{0.5,1.5,-0.5}'
+        out = np.zeros(3)
+
+        data = self.oscilloscope.get_data(1, out=out)
+
+        self.assertIs(out, data)
+        self.assertEqual([0.5, 1.5, -0.5], out.tolist())
+
+    def test_get_data_larger_than_buffer(self):
+        self.connection.buffer = '{0.5,1.5,-0.5}'
+        with self.assertRaises(ValueError):
+            self.oscilloscope.get_data(1, out=np.zeros(2))
+
+    def test_get_acquisition_reuses_pooled_buffers(self):
+        connection = SequenceScpiConnection('64', 'TD', '{0.5,1.5}', 'TD', '{1.0,2.0}')
+        oscilloscope = Oscilloscope(connection, cache=True)
+        pool = BufferPool(size=4)
+
+        first = oscilloscope.get_acquisition(1, out=pool)
+        pool.release(first)
+        second = oscilloscope.get_acquisition(1, out=pool)
+
+        self.assertEqual([1.0, 2.0], second.voltages.tolist())
+        self.assertEqual(1, pool.allocated)
+
     def test_get_acquisition(self):
+        connection = SequenceScpiConnection('64', 'TD', '{0.5,1.5,-0.5}')
+        oscilloscope = Oscilloscope(connection)
         channel = 1
-        times, voltages = self.oscilloscope.get_acquisition(channel)
+
+        acquisition = oscilloscope.get_acquisition(channel)
+
+        self.assertEqual(['ACQ:DEC?', 'ACQ:TRIG:STAT?', 'ACQ:SOUR1:DATA?'], connection.written_messages)
+        self.assertEqual([0.5, 1.5, -0.5], acquisition.voltages.tolist())
+        self.assertEqual(channel, acquisition.channel)
+        self.assertEqual(64, acquisition.decimation_factor)
+        self.assertIsNone(acquisition.trigger_delay_in_samples)
+        self.assertAlmostEqual(64 / 125e6, acquisition.sampling_interval)
+
+    def test_get_acquisition_attaches_cached_trigger_delay(self):
+        connection = SequenceScpiConnection('100', '64', 'TD', '{0.5}', 'TD', '{1.5}')
+        oscilloscope = Oscilloscope(connection, cache=True)
+        oscilloscope.get_trigger_delay_in_samples()
+
+        first = oscilloscope.get_acquisition(1)
+        second = oscilloscope.get_acquisition(1)
+
+        self.assertEqual([100, 100], [first.trigger_delay_in_samples, second.trigger_delay_in_samples])
+        self.assertEqual(1, connection.written_messages.count('ACQ:TRIG:DLY?'))
+
+    def test_partial_data_messages(self):
+        connection = SequenceScpiConnection('{0.5}', '{0.5}', '{0.5}', '8192')
+        oscilloscope = Oscilloscope(connection)
+
+        oscilloscope.get_data_between(1, 100, 199)
+        oscilloscope.get_oldest_data(2, 50)
+        oscilloscope.get_latest_data(1, 50)
+        self.assertEqual(8192, oscilloscope.get_trigger_position())
+
+        self.assertEqual(['ACQ:SOUR1:DATA:STA:END? 100,199', 'ACQ:SOUR2:DATA:OLD:N? 50',
+                          'ACQ:SOUR1:DATA:LAT:N? 50', 'ACQ:TPOS?'], connection.written_messages)
+
+    def test_get_acquisition_in_trigger_window(self):
+        connection = SequenceScpiConnection('64', 'TD', '8192', '{0.5,1.5,-0.5,0.5,1.5,-0.5}')
+        oscilloscope = Oscilloscope(connection)
+        sampling_interval = 64 / 125e6
+
+        acquisition = oscilloscope.get_acquisition(1, window=TriggerWindow(-2 * sampling_interval,
+                                                                           3 * sampling_interval))
+
+        self.assertEqual(['ACQ:DEC?', 'ACQ:TRIG:STAT?', 'ACQ:TPOS?', 'ACQ:SOUR1:DATA:STA:END? 8190,8195'],
+                         connection.written_messages)
+        self.assertAlmostEqual(-2 * sampling_interval, acquisition.start_time)
+        self.assertAlmostEqual(0.0, acquisition.times[2])
+
+    def test_trigger_window_wraps_around_buffer(self):
+        connection = SequenceScpiConnection('1', 'TD', '1', '{0.5}')
+        oscilloscope = Oscilloscope(connection)
+
+        oscilloscope.get_acquisition(1, window=TriggerWindow(-2 / 125e6, 0))
+
+        self.assertIn('ACQ:SOUR1:DATA:STA:END? 16383,1', connection.written_messages)
+
+    def test_trigger_window_longer_than_buffer(self):
+        connection = SequenceScpiConnection('1', 'TD', '0')
+        oscilloscope = Oscilloscope(connection)
+
+        with self.assertRaises(ValueError):
+            oscilloscope.get_acquisition(1, window=TriggerWindow(0, 1e-3))
+
+    def test_get_acquisitions_pipelines_channel_reads(self):
+        link = link_receiving('64\r\n', 'TD\r\n', '{0.5,1.5}\r\n{2.5,3.5}\r\n')
+        link.write.side_effect = len
+        oscilloscope = Oscilloscope(ScpiConnection(link))
+
+        acquisition = oscilloscope.get_acquisitions((1, 2))
+
+        self.assertIn(((('ACQ:SOUR1:DATA?\r\nACQ:SOUR2:DATA?\r\n',), {})), link.write.call_args_list)
+        self.assertEqual([[0.5, 1.5], [2.5, 3.5]], acquisition.voltages.tolist())
+        self.assertEqual((1, 2), acquisition.channels)
+        self.assertEqual(64, acquisition.decimation_factor)
+
+    def test_get_acquisition_unpacks_to_times_and_voltages(self):
+        connection = SequenceScpiConnection('8', 'WAIT', 'TD', '{0.5,1.5}')
+        oscilloscope = Oscilloscope(connection)
+
+        times, voltages = oscilloscope.get_acquisition(2)
+
+        self.assertEqual([0.0, 8 / 125e6], times.tolist())
+        self.assertEqual([0.5, 1.5], voltages.tolist())
+
+    def test_get_acquisition_records_trigger_statistics(self):
+        connection = SequenceScpiConnection('1', 'WAIT', 'WAIT', 'TD', '{0.5}')
+        oscilloscope = Oscilloscope(connection)
+
+        oscilloscope.get_acquisition(1)
+
+        statistics = oscilloscope.trigger_wait.statistics
+        self.assertEqual(1, statistics.triggers)
+        self.assertEqual(3, statistics.polls)
+        self.assertEqual(1, statistics.readouts)
+        self.assertGreater(statistics.mean_trigger_to_readout, 0)
+
+    def test_get_acquisition_times_out_without_trigger(self):
+        connection = SequenceScpiConnection('1', *['WAIT'] * 1000)
+        oscilloscope = Oscilloscope(connection)
+
+        with self.assertRaises(TriggerTimeoutError):
+            oscilloscope.get_acquisition(1, timeout=0.005)
+        self.assertEqual(1, oscilloscope.trigger_wait.statistics.timeouts)
+
+    def test_wait_for_trigger_with_notification(self):
+        connection = SequenceScpiConnection()
+        notifications = []
+
+        def notify(oscilloscope, timeout):
+            notifications.append(timeout)
+            return True
+
+        oscilloscope = Oscilloscope(connection, trigger_wait=TriggerWait(timeout=2, notify=notify))
+        oscilloscope.wait_for_trigger(decimation_factor=1)
+
+        self.assertEqual([2], notifications)
+        self.assertEqual([], connection.written_messages)
+
+    def test_wait_for_trigger_notification_timeout(self):
+        oscilloscope = Oscilloscope(SequenceScpiConnection(),
+                                    trigger_wait=TriggerWait(notify=lambda oscilloscope, timeout: False))
+        with self.assertRaises(TriggerTimeoutError):
+            oscilloscope.wait_for_trigger(timeout=0.1, decimation_factor=1)
+
+    def test_wait_for_trigger_can_be_stopped(self):
+        stop = Event()
+        stop.set()
+        oscilloscope = Oscilloscope(SequenceScpiConnection('WAIT'))
+        self.assertIsNone(oscilloscope.wait_for_trigger(decimation_factor=1, stop=stop))
+
+    def test_wait_for_notification_can_be_stopped(self):
+        stop = Event()
+        stop.set()
+        oscilloscope = Oscilloscope(SequenceScpiConnection(),
+                                    trigger_wait=TriggerWait(notify=lambda oscilloscope, timeout: False))
+        self.assertIsNone(oscilloscope.wait_for_trigger(decimation_factor=1, stop=stop))
+
+    def test_stream_with_immediate_trigger(self):
+        connection = SequenceScpiConnection('1', '0', 'TD', '{0.5,1.5}', 'WAIT', 'TD', '{2.5,3.5}')
+        oscilloscope = Oscilloscope(connection)
+
+        stream = oscilloscope.stream(1, count=2)
+        acquisitions = list(stream)
+
+        self.assertEqual([[0.5, 1.5], [2.5, 3.5]], [acquisition.voltages.tolist() for acquisition in acquisitions])
+        self.assertEqual(['ACQ:DEC?', 'ACQ:TRIG:DLY?', 'ACQ:START',
+                          'ACQ:TRIG NOW', 'ACQ:TRIG:STAT?', 'ACQ:SOUR1:DATA?', 'ACQ:START',
+                          'ACQ:TRIG NOW', 'ACQ:TRIG:STAT?', 'ACQ:TRIG:STAT?', 'ACQ:SOUR1:DATA?', 'ACQ:START'],
+                         connection.written_messages)
+        self.assertEqual(2, stream.statistics.acquired)
+        self.assertEqual(0, stream.statistics.dropped)
+
+    def test_stream_rearms_trigger_event_and_reports_late_acquisitions(self):
+        connection = SequenceScpiConnection('1', '0', 'TD', '{0.5}', 'TD', '{1.5}')
+        oscilloscope = Oscilloscope(connection)
+
+        stream = oscilloscope.stream(2, TriggerSource.EXT, Edge.NEGATIVE, count=2, period=1e-6)
+        list(stream)
+
+        self.assertEqual(2, connection.written_messages.count('ACQ:TRIG EXT_NE'))
+        self.assertEqual(1, stream.statistics.late)
+        self.assertGreater(stream.statistics.dropped, 0)
 
     def test_set_trigger_delay_in_ns(self):
         connection = MockScpiConnection('ACQ:TRIG:DLY:NS 128')
@@ -319,6 +1029,9 @@ class TestScpiConnection(object):
 
     def read(self, number_of_bytes=4096):
         return self._buffer
+
+    def read_block(self, number_of_bytes=4096):
+        return self._buffer
     
     @property
     def buffer(self):
@@ -359,3 +1072,25 @@ class MockScpiConnection(object):
     def read(self, number_of_bytes=4096):
         self._is_read_called = True
         return self._response
+
+
+class SequenceScpiConnection(object):
+    def __init__(self, *responses):
+        self._responses = list(responses)
+        self.written_messages = []
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, message):
+        self.written_messages.append(message)
+        return len(message)
+
+    def read(self, number_of_bytes=4096):
+        return self._responses.pop(0)
+
+    def read_block(self, number_of_bytes=4096):
+        return self._responses.pop(0)
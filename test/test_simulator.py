@@ -0,0 +1,246 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+from errno import ECONNREFUSED, ECONNRESET
+from socket import error as socket_error, socket, AF_UNIX, SOCK_STREAM
+from threading import Thread
+from time import time
+from mock import Mock
+import numpy as np
+from scpipy.scpi import *
+from scpipy.links import LoopbackLink, TcpIpLink, UnixSocketLink
+from scpipy.simulator import SimulatedRedPitaya, SimulatorServer
+
+
+class SimulatedRedPitayaTest(TestCase):
+    def setUp(self):
+        self.instrument = SimulatedRedPitaya(noise=0.0, seed=0)
+
+    def test_decimation_factor(self):
+        self.instrument.handle('ACQ:DEC 64')
+        self.assertEqual('64', self.instrument.handle('ACQ:DEC?'))
+
+    def test_trigger_waits_for_post_trigger_samples(self):
+        self.instrument.handle('ACQ:DEC 65536')
+        self.instrument.handle('ACQ:START')
+        self.instrument.handle('ACQ:TRIG NOW')
+        self.assertEqual('WAIT', self.instrument.handle('ACQ:TRIG:STAT?'))
+
+    def test_generator_output_is_sampled(self):
+        self.instrument.handle('SOUR1:FUNC SQUARE')
+        self.instrument.handle('SOUR1:FREQ:FIX 100000')
+        self.instrument.handle('SOUR1:VOLT 0.5')
+        self.instrument.handle('OUTPUT1:STATE ON')
+        self.assertEqual([-0.5, 0.5], sorted(set(self.instrument.samples(1).tolist())))
+
+    def test_disabled_output_is_flat(self):
+        self.assertEqual(0.0, np.abs(self.instrument.samples(2)).max())
+
+    def test_buffer_ranges_wrap_around(self):
+        self.instrument.buffer_size = 8
+        self.instrument.samples = lambda channel: np.arange(8.0)
+        self.assertEqual('{6,7,0,1}', self.instrument.handle('ACQ:SOUR1:DATA:STA:END? 6,1'))
+        self.assertEqual('{3,4}', self.instrument.handle('ACQ:SOUR1:DATA:STA:N? 3,2'))
+        self.assertEqual('{0,1,2}', self.instrument.handle('ACQ:SOUR1:DATA:OLD:N? 3'))
+        self.assertEqual('{5,6,7}', self.instrument.handle('ACQ:SOUR1:DATA:LAT:N? 3'))
+
+    def test_trigger_position_follows_trigger_delay(self):
+        self.assertEqual('8192', self.instrument.handle('ACQ:TPOS?'))
+        self.instrument.handle('ACQ:TRIG:DLY 100')
+        self.assertEqual('8092', self.instrument.handle('ACQ:TPOS?'))
+
+    def test_unknown_query(self):
+        self.assertEqual('ERR!', self.instrument.handle('FOO:BAR?'))
+        self.assertEqual(['FOO:BAR?'], self.instrument.errors)
+
+    def test_unknown_channel(self):
+        self.assertIsNone(self.instrument.handle('SOUR3:FREQ:FIX 10'))
+        self.assertEqual(['SOUR3:FREQ:FIX 10'], self.instrument.errors)
+
+
+class SimulatorServerTest(TestCase):
+    def setUp(self):
+        self.server = SimulatorServer(SimulatedRedPitaya(seed=0)).start()
+        self.connection = get_tcpip_scpi_connection(self.server.host, self.server.port)
+        self.connection.open()
+
+    def test_digital_controller(self):
+        controller = DigitalController(self.connection)
+        controller.set_direction('DIO0_N', Direction.OUTPUT)
+        controller.set_state('DIO0_N', State.HIGH)
+        self.assertEqual(State.HIGH, controller.get_state('DIO0_N'))
+
+    def test_analog_controller(self):
+        controller = AnalogController(self.connection)
+        controller.set_analog_output('AOUT1', 1.25)
+        self.assertAlmostEqual(1.25, controller.get_analog_input('AOUT1'))
+
+    def test_triggered_acquisition(self):
+        generator = Generator(self.connection)
+        generator.set_waveform(1, Waveform.SINE)
+        generator.set_frequency(1, 10000)
+        generator.set_amplitude(1, 0.8)
+        generator.enable_output(1)
+
+        oscilloscope = Oscilloscope(self.connection)
+        oscilloscope.set_decimation_factor(8)
+        oscilloscope.start()
+        oscilloscope.set_trigger_event(TriggerSource.CH1, Edge.POSITIVE)
+        acquisition = oscilloscope.get_acquisition(1, timeout=1)
+
+        self.assertEqual(16384, len(acquisition))
+        self.assertAlmostEqual(0.8, acquisition.voltages.max(), delta=0.05)
+        self.assertEqual(8, acquisition.decimation_factor)
+
+    def test_binary_acquisition(self):
+        oscilloscope = Oscilloscope(self.connection)
+        oscilloscope.set_data_format(DataFormat.BINARY)
+        oscilloscope.start()
+        oscilloscope.trigger_immediately()
+        acquisition = oscilloscope.get_acquisition(2, timeout=1)
+        self.assertEqual(np.float32, acquisition.voltages.dtype)
+        self.assertEqual(16384, len(acquisition))
+
+    def test_windowed_acquisition_transfers_only_the_window(self):
+        oscilloscope = Oscilloscope(self.connection)
+        oscilloscope.set_decimation_factor(8)
+        oscilloscope.start()
+        oscilloscope.trigger_immediately()
+        sampling_interval = 8 / 125e6
+        received = self.connection.bytes_received
+        acquisition = oscilloscope.get_acquisition(1, timeout=1,
+                                                   window=TriggerWindow(-100 * sampling_interval,
+                                                                        719 * sampling_interval))
+        windowed_bytes = self.connection.bytes_received - received
+
+        self.assertEqual(820, len(acquisition))
+        self.assertAlmostEqual(-100 * sampling_interval, acquisition.start_time)
+        received = self.connection.bytes_received
+        oscilloscope.get_data(1)
+        self.assertLess(windowed_bytes, 0.1 * (self.connection.bytes_received - received))
+
+    def test_two_channel_acquisition(self):
+        generator = Generator(self.connection)
+        generator.set_frequency(2, 100000)
+        generator.set_amplitude(2, 0.5)
+        generator.enable_output(2)
+        oscilloscope = Oscilloscope(self.connection)
+        oscilloscope.start()
+        oscilloscope.trigger_immediately()
+        acquisition = oscilloscope.get_acquisitions((1, 2), timeout=1)
+        self.assertEqual((2, 16384), acquisition.voltages.shape)
+        self.assertLess(acquisition.for_channel(1).voltages.max(), 0.1)
+        self.assertAlmostEqual(0.5, acquisition.for_channel(2).voltages.max(), delta=0.05)
+
+    def test_arbitrary_waveform_upload(self):
+        generator = Generator(self.connection)
+        generator.set_arbitrary_waveform_data(1, np.linspace(-1, 1, 16384))
+        AnalogController(self.connection).get_analog_input('AIN0')
+        data = self.server.instrument.generator[1]['data']
+        self.assertEqual(16384, len(data))
+        self.assertAlmostEqual(-1.0, data[0])
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.stop()
+
+
+class SimulatorServerDisconnectTest(TestCase):
+    def setUp(self):
+        self.server = SimulatorServer()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_connection_reset_ends_the_session(self):
+        connection = Mock()
+        connection.recv.side_effect = ['DIG:PIN? LED1\r\n', socket_error(ECONNRESET, 'Connection reset by peer')]
+        self.server.serve(connection)
+        connection.sendall.assert_called_once_with('0\r\n')
+
+    def test_other_socket_errors_are_raised(self):
+        connection = Mock()
+        connection.recv.side_effect = socket_error(ECONNREFUSED, 'Connection refused')
+        with self.assertRaises(socket_error):
+            self.server.serve(connection)
+
+
+class SimulatorServerTimingTest(TestCase):
+    def test_latency(self):
+        with SimulatorServer(latency=0.02) as server:
+            with get_tcpip_scpi_connection(server.host, server.port) as connection:
+                oscilloscope = Oscilloscope(connection)
+                start = time()
+                oscilloscope.get_decimation_factor()
+                self.assertGreaterEqual(time() - start, 0.02)
+
+    def test_bandwidth(self):
+        with SimulatorServer(bandwidth=2e6) as server:
+            with get_tcpip_scpi_connection(server.host, server.port) as connection:
+                oscilloscope = Oscilloscope(connection)
+                start = time()
+                oscilloscope.get_data(1)
+                self.assertGreaterEqual(time() - start, 0.05)
+
+
+class LocalLinkTest(TestCase):
+    def setUp(self):
+        self.server = SimulatorServer(SimulatedRedPitaya(seed=0))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def check_connection(self, connection):
+        with connection:
+            oscilloscope = Oscilloscope(connection)
+            oscilloscope.set_decimation_factor(64)
+            self.assertEqual(64, oscilloscope.get_decimation_factor())
+            self.assertEqual(16384, len(oscilloscope.get_data(1)))
+
+    def test_loopback_connection(self):
+        connection = get_scpi_connection('loopback://', serve=self.server.serve)
+        self.assertIsInstance(connection._link, LoopbackLink)
+        self.check_connection(connection)
+
+    def test_unix_socket_connection(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'scpi.sock')
+        listener = socket(AF_UNIX, SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(1)
+
+        def accept():
+            client, _ = listener.accept()
+            self.server.serve(client)
+            client.close()
+
+        thread = Thread(target=accept)
+        thread.daemon = True
+        thread.start()
+        try:
+            connection = get_scpi_connection('unix://' + path)
+            self.assertIsInstance(connection._link, UnixSocketLink)
+            self.check_connection(connection)
+        finally:
+            listener.close()
+            shutil.rmtree(directory)
+
+    def test_tcp_connection(self):
+        self.server.start()
+        connection = get_scpi_connection('tcp://{}:{}'.format(self.server.host, self.server.port), timeout=1)
+        self.assertIsInstance(connection._link, TcpIpLink)
+        self.check_connection(connection)
+
+    def test_bare_host_defaults_to_tcp(self):
+        link = get_scpi_link('rp-f0060c.local')
+        self.assertEqual(('rp-f0060c.local', 5000), (link.address.host, link.address.port))
+        link.close()
+
+    def test_unsupported_url(self):
+        with self.assertRaises(ValueError):
+            get_scpi_link('serial:///dev/ttyUSB0')
+
+    def test_loopback_needs_serve(self):
+        with self.assertRaises(ValueError):
+            get_scpi_link('loopback://')
@@ -0,0 +1,81 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import numpy as np
+from scpipy.scpi import Acquisition
+from scpipy.storage import CaptureReader, CaptureWriter, open_capture
+
+
+def acquisition(value, channel=1, number_of_samples=4, timestamp=100.0):
+    voltages = np.full(number_of_samples, value) if not isinstance(channel, tuple) else \
+        np.vstack([np.full(number_of_samples, value + index) for index in range(len(channel))])
+    return Acquisition(voltages, sampling_interval=8 / 125e6, start_time=-1e-7, channel=channel,
+                       decimation_factor=8, trigger_delay_in_samples=10, timestamp=timestamp + value)
+
+
+class CaptureTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'capture.scap')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        with CaptureWriter(self.path, metadata={'run': 'overnight'}) as writer:
+            writer.extend(acquisition(value) for value in range(3))
+
+        capture = open_capture(self.path)
+        self.assertEqual(3, len(capture))
+        self.assertEqual({'run': 'overnight'}, capture.metadata)
+        self.assertEqual([100.0, 101.0, 102.0], capture.timestamps.tolist())
+        restored = capture[2]
+        self.assertEqual([2.0] * 4, restored.voltages.tolist())
+        self.assertEqual(1, restored.channel)
+        self.assertEqual(8, restored.decimation_factor)
+        self.assertEqual(10, restored.trigger_delay_in_samples)
+        self.assertAlmostEqual(-1e-7, restored.start_time)
+
+    def test_file_grows_in_chunks(self):
+        writer = CaptureWriter(self.path, chunk_size=2)
+        writer.append(acquisition(0))
+        size = os.path.getsize(self.path)
+        writer.append(acquisition(1))
+        self.assertEqual(size, os.path.getsize(self.path))
+        writer.append(acquisition(2))
+        self.assertGreater(os.path.getsize(self.path), size)
+        writer.close()
+        self.assertEqual(3, len(CaptureReader(self.path)))
+
+    def test_capture_is_readable_while_in_progress(self):
+        writer = CaptureWriter(self.path, chunk_size=8)
+        writer.append(acquisition(0))
+        writer.flush()
+        reader = CaptureReader(self.path)
+        self.assertEqual(1, len(reader))
+
+        writer.append(acquisition(1))
+        writer.flush()
+        self.assertEqual(2, reader.refresh())
+        self.assertEqual([1.0] * 4, reader[1].voltages.tolist())
+        writer.close()
+
+    def test_stacked_channels(self):
+        with CaptureWriter(self.path) as writer:
+            writer.append(acquisition(0, channel=(1, 2)))
+        restored = open_capture(self.path)[0]
+        self.assertEqual((1, 2), restored.channels)
+        self.assertEqual([1.0] * 4, restored.for_channel(2).voltages.tolist())
+
+    def test_mismatched_acquisition_is_rejected(self):
+        with CaptureWriter(self.path) as writer:
+            writer.append(acquisition(0))
+            with self.assertRaises(ValueError):
+                writer.append(acquisition(1, number_of_samples=8))
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as capture_file:
+            capture_file.write('not a capture')
+        with self.assertRaises(ValueError):
+            open_capture(self.path)